@@ -0,0 +1,109 @@
+import math
+import re
+from typing import Optional
+
+### Interview context
+
+# Documents are plain dicts so they checkpoint like the rest of the state:
+# {"kind": "web" | "wikipedia" | "local", "source": url or source, "page": page or "", "content": text}
+
+# Partial documents shorter than this are not worth including
+MIN_PARTIAL_TOKENS = 100
+
+SEPARATOR = "\n\n---\n\n"
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text, at about four characters per token."""
+    return (len(text) + 3) // 4
+
+def web_document(url: str, content: str) -> dict:
+    return {"kind": "web", "source": url, "page": "", "content": content}
+
+def wikipedia_document(source: str, page: str, content: str) -> dict:
+    return {"kind": "wikipedia", "source": source, "page": str(page), "content": content}
+
+def local_document(source: str, page: str, content: str) -> dict:
+    return {"kind": "local", "source": source, "page": str(page), "content": content}
+
+def document_key(doc: dict) -> str:
+    """Documents with the same source and page are the same document."""
+    return f"{doc['source']}#{doc['page']}" if doc["page"] else doc["source"]
+
+def documents(docs: list[dict]) -> dict[str, dict]:
+    """Key documents for a context update, merging duplicates within the list."""
+    keyed: dict[str, dict] = {}
+    for doc in docs:
+        keyed = merge_documents(keyed, {document_key(doc): doc})
+    return keyed
+
+def merge_documents(left: Optional[dict[str, dict]], right: Optional[dict[str, dict]]) -> dict[str, dict]:
+    """Reducer for the interview context: add new documents by key, in arrival order.
+
+    A document found again keeps its place. Web searches return query-dependent
+    snippets of the same page, so content not already present is appended.
+    """
+    merged = dict(left or {})
+    for key, doc in (right or {}).items():
+        existing = merged.get(key)
+        if existing is None:
+            merged[key] = doc
+        elif doc["content"] not in existing["content"]:
+            merged[key] = {**existing, "content": existing["content"] + "\n\n...\n\n" + doc["content"]}
+    return merged
+
+def _vocabulary(docs: dict[str, dict]) -> set[str]:
+    return {word for doc in docs.values() for word in _WORD_RE.findall(doc["content"].lower())}
+
+def novelty(context: Optional[dict[str, dict]], new: dict[str, dict]) -> dict:
+    """How much a retrieval adds to the context: the distinct words of the new
+    documents, and how many of them the context does not contain yet.
+
+    Unseen URLs repeating what is already known, such as mirrors and snippets of
+    the same page, add few new words.
+    """
+    retrieved = _vocabulary(new)
+    return {"novel": len(retrieved - _vocabulary(context or {})), "retrieved": len(retrieved)}
+
+def format_document(doc: dict, content: Optional[str] = None) -> str:
+    """Format a document with the <Document .../> header the prompts cite from."""
+    content = doc["content"] if content is None else content
+    if doc["kind"] == "web":
+        return f'<Document href="{doc["source"]}"/>\n{content}\n</Document>'
+    return f'<Document source="{doc["source"]}" page="{doc["page"]}"/>\n{content}\n</Document>'
+
+def _relevance(doc: dict, query_words: set[str]) -> float:
+    words = _WORD_RE.findall(doc["content"].lower())
+    if not words:
+        return 0.0
+    return len(query_words.intersection(words)) / math.sqrt(len(set(words)))
+
+def render_documents(docs: dict[str, dict], token_budget: int, query: Optional[str] = None) -> str:
+    """Format the documents within about `token_budget` tokens.
+
+    With a query, the documents sharing most words with it come first; otherwise
+    they keep arrival order. The document that crosses the budget is cut short,
+    and the rest are left out.
+    """
+    ordered = list(docs.values())
+    if query:
+        query_words = set(_WORD_RE.findall(query.lower()))
+        ordered.sort(key=lambda doc: _relevance(doc, query_words), reverse=True)
+
+    parts, remaining = [], token_budget
+    for doc in ordered:
+        if parts:
+            remaining -= estimate_tokens(SEPARATOR)
+        formatted = format_document(doc)
+        tokens = estimate_tokens(formatted)
+        if tokens <= remaining:
+            parts.append(formatted)
+            remaining -= tokens
+            continue
+        # Room left for the header plus a useful part of the content
+        room = remaining - estimate_tokens(format_document(doc, ""))
+        if room >= MIN_PARTIAL_TOKENS:
+            parts.append(format_document(doc, doc["content"][:room * 4].rstrip() + " ..."))
+        break
+    return SEPARATOR.join(parts)
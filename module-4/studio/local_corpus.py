@@ -0,0 +1,165 @@
+import argparse
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import numpy as np
+
+from langchain_core.documents import Document
+
+### Local corpus search
+
+# Index a directory of documents once, then search it without the network:
+#
+#   python local_corpus.py ./docs --index ./corpus_index
+#   LOCAL_CORPUS_INDEX=./corpus_index langgraph dev
+
+TEXT_EXTENSIONS = (".txt", ".md", ".rst")
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+def index_path() -> str:
+    """Index directory set by LOCAL_CORPUS_INDEX."""
+    return os.environ.get("LOCAL_CORPUS_INDEX") or os.path.join(
+        os.path.expanduser("~"), ".cache", "langchain-academy", "local_corpus")
+
+def _read_pdf(path: str) -> Iterator[tuple[str, str]]:
+    from pypdf import PdfReader
+    for number, page in enumerate(PdfReader(path).pages, start=1):
+        yield str(number), page.extract_text() or ""
+
+def read_documents(directory: str) -> Iterator[tuple[str, str, str]]:
+    """Yield (source, page, text) for every text file and PDF page under the directory.
+
+    Sources are paths relative to the directory; text files have no page.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            source = os.path.relpath(path, directory)
+            extension = os.path.splitext(name)[1].lower()
+            if extension == ".pdf":
+                for page, text in _read_pdf(path):
+                    yield source, page, text
+            elif extension in TEXT_EXTENSIONS:
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    yield source, "", f.read()
+
+def chunk_text(text: str, chunk_words: int = 200) -> list[str]:
+    """Split text into chunks of about `chunk_words` words, overlapping by a quarter."""
+    words = text.split()
+    step = max(1, chunk_words - chunk_words // 4)
+    return [" ".join(words[start:start + chunk_words])
+            for start in range(0, max(1, len(words) - chunk_words + step), step) if words[start:start + chunk_words]]
+
+class LocalCorpus:
+    """BM25 index over chunks of local documents, stored as NumPy arrays.
+
+    Postings are sorted by term, so the chunks and term frequencies of term `t`
+    are `doc_ids[term_ptr[t]:term_ptr[t + 1]]` and the same slice of `tf`.
+    """
+
+    k1 = 1.5
+    b = 0.75
+
+    def __init__(self, chunks: list[dict], vocabulary: list[str], term_ptr: np.ndarray,
+                 doc_ids: np.ndarray, tf: np.ndarray, doc_len: np.ndarray):
+        self.chunks = chunks
+        self.term_ids = {term: i for i, term in enumerate(vocabulary)}
+        self.vocabulary = vocabulary
+        self.term_ptr = term_ptr
+        self.doc_ids = doc_ids
+        self.tf = tf
+        self.doc_len = doc_len
+        df = np.diff(term_ptr)
+        self.idf = np.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+        self.avg_len = float(doc_len.mean()) if len(doc_len) else 0.0
+
+    @classmethod
+    def build(cls, directory: str, chunk_words: int = 200) -> "LocalCorpus":
+        """Read, chunk and index every document under the directory."""
+        chunks, postings = [], Counter()
+        for source, page, text in read_documents(directory):
+            for content in chunk_text(text, chunk_words):
+                postings.update((term, len(chunks)) for term in tokenize(content))
+                chunks.append({"source": source, "page": page, "content": content})
+
+        vocabulary = sorted({term for term, _ in postings})
+        term_ids = {term: i for i, term in enumerate(vocabulary)}
+        entries = sorted((term_ids[term], doc, count) for (term, doc), count in postings.items())
+        terms = np.array([e[0] for e in entries], dtype=np.int64)
+        doc_ids = np.array([e[1] for e in entries], dtype=np.int32)
+        tf = np.array([e[2] for e in entries], dtype=np.float32)
+        term_ptr = np.searchsorted(terms, np.arange(len(vocabulary) + 1))
+        doc_len = np.bincount(doc_ids, weights=tf, minlength=len(chunks)).astype(np.float32)
+        return cls(chunks, vocabulary, term_ptr, doc_ids, tf, doc_len)
+
+    def save(self, path: str) -> None:
+        """Write the index to a directory, replacing any index already there."""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "chunks.jsonl.tmp"), "w", encoding="utf-8") as f:
+            for chunk in self.chunks:
+                f.write(json.dumps(chunk) + "\n")
+        np.savez(os.path.join(path, "index.tmp.npz"), vocabulary=np.array(self.vocabulary, dtype=str),
+                 term_ptr=self.term_ptr, doc_ids=self.doc_ids, tf=self.tf, doc_len=self.doc_len)
+        os.replace(os.path.join(path, "chunks.jsonl.tmp"), os.path.join(path, "chunks.jsonl"))
+        os.replace(os.path.join(path, "index.tmp.npz"), os.path.join(path, "index.npz"))
+
+    @classmethod
+    def load(cls, path: str) -> "LocalCorpus":
+        with open(os.path.join(path, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f]
+        with np.load(os.path.join(path, "index.npz")) as arrays:
+            return cls(chunks, arrays["vocabulary"].tolist(), arrays["term_ptr"], arrays["doc_ids"],
+                       arrays["tf"], arrays["doc_len"])
+
+    def search(self, query: str, k: int = 4) -> list[Document]:
+        """The `k` chunks scoring highest for the query by BM25."""
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self.term_ids.get(term)
+            if t is None:
+                continue
+            start, end = self.term_ptr[t], self.term_ptr[t + 1]
+            docs, tf = self.doc_ids[start:end], self.tf[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self.doc_len[docs] / self.avg_len)
+            scores[docs] += self.idf[t] * tf * (self.k1 + 1) / (tf + norm)
+
+        top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [Document(page_content=self.chunks[i]["content"],
+                         metadata={"source": self.chunks[i]["source"], "page": self.chunks[i]["page"]})
+                for i in top if scores[i] > 0]
+
+@lru_cache(maxsize=1)
+def _load(path: str, mtime: float) -> LocalCorpus:
+    return LocalCorpus.load(path)
+
+def has_index(path: Optional[str] = None) -> bool:
+    return os.path.exists(os.path.join(path or index_path(), "index.npz"))
+
+def local_search(query: str, k: int = 4) -> list[Document]:
+    """Chunks of the local corpus as Documents with source and page, best first."""
+    path = index_path()
+    if not has_index(path):
+        raise FileNotFoundError(f"No local corpus index in {path}; build one with `python local_corpus.py DIRECTORY`")
+    # Loaded once per process, and again after the index is rebuilt
+    return _load(path, os.path.getmtime(os.path.join(path, "index.npz"))).search(query, k)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index a directory of text and PDF files for local search")
+    parser.add_argument("directory", help="documents to index (.txt, .md, .rst and .pdf)")
+    parser.add_argument("--index", default=index_path(), help="index directory (default: LOCAL_CORPUS_INDEX)")
+    parser.add_argument("--chunk-words", type=int, default=200, help="words per indexed chunk")
+    args = parser.parse_args()
+
+    corpus = LocalCorpus.build(args.directory, args.chunk_words)
+    corpus.save(args.index)
+    print(f"Indexed {len(corpus.chunks)} chunks, {len(corpus.vocabulary)} terms into {args.index}")
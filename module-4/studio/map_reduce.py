@@ -9,6 +9,8 @@ from langchain_openai import ChatOpenAI
 from langgraph.constants import Send
 from langgraph.graph import END, StateGraph, START
 
+from runnable_registry import registry
+
 # Prompts we will use
 subjects_prompt = """Generate a list of 3 sub-topics that are all related to this overall topic: {topic}."""
 joke_prompt = """Generate a joke about {subject}"""
@@ -32,7 +34,7 @@ class OverallState(TypedDict):
 
 def generate_topics(state: OverallState):
     prompt = subjects_prompt.format(topic=state["topic"])
-    response = model.with_structured_output(Subjects).invoke(prompt)
+    response = registry.structured_output(model, Subjects).invoke(prompt)
     return {"subjects": response.subjects}
 
 class JokeState(TypedDict):
@@ -43,13 +45,13 @@ class Joke(BaseModel):
 
 def generate_joke(state: JokeState):
     prompt = joke_prompt.format(subject=state["subject"])
-    response = model.with_structured_output(Joke).invoke(prompt)
+    response = registry.structured_output(model, Joke).invoke(prompt)
     return {"jokes": [response.joke]}
 
 def best_joke(state: OverallState):
     jokes = "\n\n".join(state["jokes"])
     prompt = best_joke_prompt.format(topic=state["topic"], jokes=jokes)
-    response = model.with_structured_output(BestJoke).invoke(prompt)
+    response = registry.structured_output(model, BestJoke).invoke(prompt)
     return {"best_selected_joke": state["jokes"][response.id]}
 
 def continue_to_jokes(state: OverallState):
@@ -5,27 +5,34 @@ from typing_extensions import TypedDict
 from langchain_core.documents import Document
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from langchain_community.document_loaders import WikipediaLoader
-from langchain_community.tools import TavilySearchResults
-
 from langchain_openai import ChatOpenAI
 
 from langgraph.graph import StateGraph, START, END
 
+from local_corpus import local_search
+from retrieval import RetrievalPolicy, enabled_retrievers, retrieve
+from scheduler import scheduler
+from search_cache import tavily_search, wikipedia_search
+
 llm = ChatOpenAI(model="gpt-4o", temperature=0) 
 
 class State(TypedDict):
     question: str
     answer: str
     context: Annotated[list, operator.add]
+    missed: Annotated[list, operator.add] # Retrievers whose search failed or missed its deadline
 
 def search_web(state):
     
     """ Retrieve docs from web search """
 
-    # Search
-    tavily_search = TavilySearchResults(max_results=3)
-    search_docs = tavily_search.invoke(state['question'])
+    # Search; if it fails or runs past the deadline, the answer goes on without web results
+    question = state['question']
+    results, missed = retrieve(lambda query: tavily_search(query, max_results=3),
+                                  [question], RetrievalPolicy.from_env("tavily"))
+    if missed:
+        return {"missed": ["tavily"]}
+    search_docs = results[question]
 
      # Format
     formatted_search_docs = "\n\n---\n\n".join(
@@ -41,9 +48,13 @@ def search_wikipedia(state):
     
     """ Retrieve docs from wikipedia """
 
-    # Search
-    search_docs = WikipediaLoader(query=state['question'], 
-                                  load_max_docs=2).load()
+    # Search; if it fails or runs past the deadline, the answer goes on without Wikipedia results
+    question = state['question']
+    results, missed = retrieve(lambda query: wikipedia_search(query, load_max_docs=2),
+                                  [question], RetrievalPolicy.from_env("wikipedia"))
+    if missed:
+        return {"missed": ["wikipedia"]}
+    search_docs = results[question]
 
      # Format
     formatted_search_docs = "\n\n---\n\n".join(
@@ -55,6 +66,33 @@ def search_wikipedia(state):
 
     return {"context": [formatted_search_docs]} 
 
+def search_local(state):
+    
+    """ Retrieve docs from the local corpus """
+
+    # Search; if it fails or runs past the deadline, the answer goes on without local results
+    question = state['question']
+    results, missed = retrieve(lambda query: local_search(query, k=4),
+                                  [question], RetrievalPolicy.from_env("local"))
+    if missed:
+        return {"missed": ["local"]}
+    search_docs = results[question]
+
+     # Format
+    formatted_search_docs = "\n\n---\n\n".join(
+        [
+            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata["page"]}"/>\n{doc.page_content}\n</Document>'
+            for doc in search_docs
+        ]
+    )
+
+    return {"context": [formatted_search_docs]} 
+
+# Retriever nodes by name, as used in RESEARCH_RETRIEVERS
+retriever_nodes = {"tavily": ("search_web", search_web),
+                   "wikipedia": ("search_wikipedia", search_wikipedia),
+                   "local": ("search_local", search_local)}
+
 def generate_answer(state):
     
     """ Node to answer a question """
@@ -69,7 +107,8 @@ def generate_answer(state):
                                                        context=context)    
     
     # Answer
-    answer = llm.invoke([SystemMessage(content=answer_instructions)]+[HumanMessage(content=f"Answer the question.")])
+    with scheduler.limit("openai"):
+        answer = llm.invoke([SystemMessage(content=answer_instructions)]+[HumanMessage(content=f"Answer the question.")])
       
     # Append it to state
     return {"answer": answer}
@@ -78,14 +117,13 @@ def generate_answer(state):
 builder = StateGraph(State)
 
 # Initialize each node with node_secret 
-builder.add_node("search_web",search_web)
-builder.add_node("search_wikipedia", search_wikipedia)
+for retriever in enabled_retrievers():
+    builder.add_node(*retriever_nodes[retriever])
 builder.add_node("generate_answer", generate_answer)
 
 # Flow
-builder.add_edge(START, "search_wikipedia")
-builder.add_edge(START, "search_web")
-builder.add_edge("search_wikipedia", "generate_answer")
-builder.add_edge("search_web", "generate_answer")
+for retriever in enabled_retrievers():
+    builder.add_edge(START, retriever_nodes[retriever][0])
+    builder.add_edge(retriever_nodes[retriever][0], "generate_answer")
 builder.add_edge("generate_answer", END)
 graph = builder.compile()
@@ -0,0 +1,102 @@
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Iterator, Optional, Union
+
+from langgraph.config import get_stream_writer
+
+### Report streaming
+
+# Sections of the final report, in the order they appear in it
+REPORT_ORDER = ("introduction", "content", "conclusion")
+
+@dataclass(frozen=True)
+class ReportToken:
+    """Text generated for a report section, as it is generated."""
+    section: str
+    text: str
+
+@dataclass(frozen=True)
+class ReportSection:
+    """A finished report section."""
+    section: str
+    content: str
+
+@dataclass(frozen=True)
+class ReportFinished:
+    """The assembled final report."""
+    final_report: str
+
+ReportEvent = Union[ReportToken, ReportSection, ReportFinished]
+
+# The graph writes plain dicts to the "custom" stream, so the events also reach
+# clients of the LangGraph server; report_event turns them back into dataclasses
+
+def write_token(section: str, text: str) -> None:
+    get_stream_writer()({"type": "report_token", "section": section, "text": text})
+
+def write_section(section: str, content: str) -> None:
+    get_stream_writer()({"type": "report_section", "section": section, "content": content})
+
+def write_finished(final_report: str) -> None:
+    get_stream_writer()({"type": "report_finished", "final_report": final_report})
+
+def report_event(payload: Any) -> Optional[ReportEvent]:
+    """Typed event for a payload of the custom stream, or None if it is not a report event."""
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("type") == "report_token":
+        return ReportToken(payload["section"], payload["text"])
+    if payload.get("type") == "report_section":
+        return ReportSection(payload["section"], payload["content"])
+    if payload.get("type") == "report_finished":
+        return ReportFinished(payload["final_report"])
+    return None
+
+class ReportOrder:
+    """Reorder report events from sections generated in parallel into report order.
+
+    Events of the section being shown pass straight through. Events of later
+    sections are held until every earlier section has finished.
+    """
+
+    def __init__(self, order: tuple[str, ...] = REPORT_ORDER):
+        self.order = order
+        self.current = 0
+        self.held: dict[str, list[ReportEvent]] = {section: [] for section in order}
+
+    def push(self, event: ReportEvent) -> list[ReportEvent]:
+        """Return the events that can be shown now that `event` arrived."""
+        if isinstance(event, ReportFinished):
+            # Everything has been generated; show whatever is still held, in order
+            ready = [held for section in self.order[self.current:] for held in self.held[section]]
+            self.current = len(self.order)
+            return ready + [event]
+        if event.section not in self.held or self.order.index(event.section) < self.current:
+            return [event]
+        self.held[event.section].append(event)
+
+        ready = []
+        while self.current < len(self.order):
+            section = self.order[self.current]
+            held, self.held[section] = self.held[section], []
+            ready += held
+            if not any(isinstance(e, ReportSection) for e in held):
+                break
+            self.current += 1
+        return ready
+
+def stream_report(graph, input: Any, config: Optional[dict] = None) -> Iterator[ReportEvent]:
+    """Run the research graph and yield its report events in report order."""
+    order = ReportOrder()
+    for payload in graph.stream(input, config, stream_mode="custom"):
+        event = report_event(payload)
+        if event is not None:
+            yield from order.push(event)
+
+async def astream_report(graph, input: Any, config: Optional[dict] = None) -> AsyncIterator[ReportEvent]:
+    """Async version of `stream_report`."""
+    order = ReportOrder()
+    async for payload in graph.astream(input, config, stream_mode="custom"):
+        event = report_event(payload)
+        if event is not None:
+            for ready in order.push(event):
+                yield ready
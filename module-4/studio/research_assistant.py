@@ -1,16 +1,29 @@
+import logging
 import operator
+from concurrent.futures import FIRST_COMPLETED, wait
 from pydantic import BaseModel, Field
 from typing import Annotated, List
 from typing_extensions import TypedDict
 
-from langchain_community.document_loaders import WikipediaLoader
-from langchain_community.tools.tavily_search import TavilySearchResults
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, get_buffer_string
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_openai import ChatOpenAI
 
 from langgraph.constants import Send
 from langgraph.graph import END, MessagesState, START, StateGraph
 
+import report_stream
+from interview_context import (documents, local_document, merge_documents, novelty, render_documents,
+                               web_document, wikipedia_document)
+from local_corpus import local_search
+from retrieval import RetrievalPolicy, enabled_retrievers, retrieve
+from runnable_registry import registry
+from scheduler import scheduler
+from search_cache import tavily_search, wikipedia_search
+
+logger = logging.getLogger(__name__)
+
 ### LLM
 
 llm = ChatOpenAI(model="gpt-4o", temperature=0) 
@@ -47,13 +60,20 @@ class GenerateAnalystsState(TypedDict):
 
 class InterviewState(MessagesState):
     max_num_turns: int # Number turns of conversation
-    context: Annotated[list, operator.add] # Source docs
+    context: Annotated[dict, merge_documents] # Source docs, keyed by source and page
+    answer_context_tokens: int # Token budget for the context of each expert answer
+    section_context_tokens: int # Token budget for the context of the section
+    max_search_queries: int # Number of search queries planned per turn
+    search_queries: list # Search queries for the current turn, shared by all retrievers
+    missed_searches: Annotated[list, operator.add] # Searches that failed or missed the retrieval deadline, as "retriever: query"
+    source_gain: Annotated[list, operator.add] # New source material found by each retrieval, per turn
+    min_source_gain: float # End the interview when a turn's retrieval adds less new material than this share
     analyst: Analyst # Analyst asking questions
     interview: str # Interview transcript
     sections: list # Final key we duplicate in outer state for Send() API
 
-class SearchQuery(BaseModel):
-    search_query: str = Field(None, description="Search query for retrieval.")
+class SearchQueries(BaseModel):
+    search_queries: List[str] = Field(description="Diverse search queries for retrieval.")
 
 class ResearchGraphState(TypedDict):
     topic: str # Research topic
@@ -61,6 +81,9 @@ class ResearchGraphState(TypedDict):
     human_analyst_feedback: str # Human feedback
     analysts: List[Analyst] # Analyst asking questions
     sections: Annotated[list, operator.add] # Send() API key
+    incremental_report: bool # Fold sections into a running draft as interviews finish
+    draft: str # Report body folded from the sections that arrived first
+    folded_sections: int # Number of sections already folded into the draft
     introduction: str # Introduction for the final report
     content: str # Content for the final report
     conclusion: str # Conclusion for the final report
@@ -92,7 +115,7 @@ def create_analysts(state: GenerateAnalystsState):
     human_analyst_feedback=state.get('human_analyst_feedback', '')
         
     # Enforce structured output
-    structured_llm = llm.with_structured_output(Perspectives)
+    structured_llm = registry.structured_output(llm, Perspectives)
 
     # System message
     system_message = analyst_instructions.format(topic=topic,
@@ -100,7 +123,8 @@ def create_analysts(state: GenerateAnalystsState):
                                                             max_analysts=max_analysts)
 
     # Generate question 
-    analysts = structured_llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content="Generate the set of analysts.")])
+    with scheduler.limit("openai"):
+        analysts = structured_llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content="Generate the set of analysts.")])
     
     # Write the list of analysis to state
     return {"analysts": analysts.analysts}
@@ -138,67 +162,105 @@ def generate_question(state: InterviewState):
 
     # Generate question 
     system_message = question_instructions.format(goals=analyst.persona)
-    question = llm.invoke([SystemMessage(content=system_message)]+messages)
+    with scheduler.limit("openai"):
+        question = llm.invoke([SystemMessage(content=system_message)]+messages)
         
     # Write messages to state
     return {"messages": [question]}
 
 # Search query writing
-search_instructions = SystemMessage(content=f"""You will be given a conversation between an analyst and an expert. 
+search_instructions = """You will be given a conversation between an analyst and an expert. 
 
-Your goal is to generate a well-structured query for use in retrieval and / or web-search related to the conversation.
+Your goal is to generate well-structured queries for use in retrieval and / or web-search related to the conversation.
         
 First, analyze the full conversation.
 
 Pay particular attention to the final question posed by the analyst.
 
-Convert this final question into a well-structured web search query""")
+Convert this final question into at most {max_search_queries} well-structured web search queries. Make each query cover a different angle of the question."""
+
+def plan_queries(state: InterviewState):
+
+    """ Node to write the search queries for this turn, once for every retriever """
+
+    # Search queries
+    max_search_queries = state.get('max_search_queries', 2)
+    structured_llm = registry.structured_output(llm, SearchQueries)
+    system_message = search_instructions.format(max_search_queries=max_search_queries)
+    with scheduler.limit("openai"):
+        queries = structured_llm.invoke([SystemMessage(content=system_message)]+state['messages'])
+
+    # Drop duplicates and keep the planned number
+    search_queries = list(dict.fromkeys(q.strip() for q in queries.search_queries if q.strip()))[:max_search_queries]
+    return {"search_queries": search_queries}
+
+def expert_turns(messages: list, name: str = "expert") -> int:
+
+    """ Number of answers the expert has given """
+
+    return len([m for m in messages if isinstance(m, AIMessage) and m.name == name])
 
 def search_web(state: InterviewState):
     
     """ Retrieve docs from web search """
 
-    # Search
-    tavily_search = TavilySearchResults(max_results=3)
+    # Search every planned query at once; failed searches and ones past the deadline are left out
+    search_queries = state['search_queries']
+    results, missed = retrieve(lambda query: tavily_search(query, max_results=3),
+                                  search_queries, RetrievalPolicy.from_env("tavily"))
 
-    # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions]+state['messages'])
-    
-    # Search
-    search_docs = tavily_search.invoke(search_query.search_query)
-
-     # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    # Pages found more than once are merged
+    search_docs = [web_document(doc["url"], doc["content"])
+                   for search_query in search_queries
+                   for doc in results.get(search_query, [])]
 
-    return {"context": [formatted_search_docs]} 
+    context = documents(search_docs)
+    gain = {"turn": expert_turns(state["messages"]), **novelty(state.get("context"), context)}
+    return {"context": context, "source_gain": [gain],
+            "missed_searches": [f"tavily: {query}" for query in missed]}
 
 def search_wikipedia(state: InterviewState):
     
     """ Retrieve docs from wikipedia """
 
-    # Search query
-    structured_llm = llm.with_structured_output(SearchQuery)
-    search_query = structured_llm.invoke([search_instructions]+state['messages'])
+    # Search every planned query at once; failed searches and ones past the deadline are left out
+    search_queries = state['search_queries']
+    results, missed = retrieve(lambda query: wikipedia_search(query, load_max_docs=2),
+                                  search_queries, RetrievalPolicy.from_env("wikipedia"))
+
+    # Pages found more than once are merged
+    search_docs = [wikipedia_document(doc.metadata["source"], doc.metadata.get("page", ""), doc.page_content)
+                   for search_query in search_queries
+                   for doc in results.get(search_query, [])]
+
+    context = documents(search_docs)
+    gain = {"turn": expert_turns(state["messages"]), **novelty(state.get("context"), context)}
+    return {"context": context, "source_gain": [gain],
+            "missed_searches": [f"wikipedia: {query}" for query in missed]}
+
+def search_local(state: InterviewState):
     
-    # Search
-    search_docs = WikipediaLoader(query=search_query.search_query, 
-                                  load_max_docs=2).load()
-
-     # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    """ Retrieve docs from the local corpus """
+
+    # Search every planned query at once; failed searches and ones past the deadline are left out
+    search_queries = state['search_queries']
+    results, missed = retrieve(lambda query: local_search(query, k=4),
+                                  search_queries, RetrievalPolicy.from_env("local"))
+
+    # Chunks found more than once are merged
+    search_docs = [local_document(doc.metadata["source"], doc.metadata["page"], doc.page_content)
+                   for search_query in search_queries
+                   for doc in results.get(search_query, [])]
 
-    return {"context": [formatted_search_docs]} 
+    context = documents(search_docs)
+    gain = {"turn": expert_turns(state["messages"]), **novelty(state.get("context"), context)}
+    return {"context": context, "source_gain": [gain],
+            "missed_searches": [f"local: {query}" for query in missed]}
+
+# Retriever nodes by name, as used in RESEARCH_RETRIEVERS
+retriever_nodes = {"tavily": ("search_web", search_web),
+                   "wikipedia": ("search_wikipedia", search_wikipedia),
+                   "local": ("search_local", search_local)}
 
 # Generate expert answer
 answer_instructions = """You are an expert being interviewed by an analyst.
@@ -236,11 +298,15 @@ def generate_answer(state: InterviewState):
     # Get state
     analyst = state["analyst"]
     messages = state["messages"]
-    context = state["context"]
+
+    # Each source once, the ones closest to the question first, within the budget
+    context = render_documents(state["context"], state.get('answer_context_tokens', 4000),
+                               query=messages[-1].content)
 
     # Answer question
     system_message = answer_instructions.format(goals=analyst.persona, context=context)
-    answer = llm.invoke([SystemMessage(content=system_message)]+messages)
+    with scheduler.limit("openai"):
+        answer = llm.invoke([SystemMessage(content=system_message)]+messages)
             
     # Name the message as coming from the expert
     answer.name = "expert"
@@ -271,14 +337,20 @@ def route_messages(state: InterviewState,
     max_num_turns = state.get('max_num_turns',2)
 
     # Check the number of expert answers 
-    num_responses = len(
-        [m for m in messages if isinstance(m, AIMessage) and m.name == name]
-    )
+    num_responses = expert_turns(messages, name)
 
     # End if expert has answered more than the max turns
     if num_responses >= max_num_turns:
         return 'save_interview'
 
+    # End if this turn's searches mostly re-found material already in the context,
+    # as the next turn would likely do the same. Turns where every search failed
+    # or timed out retrieved nothing and say nothing about the gain
+    gains = [gain for gain in state.get('source_gain', []) if gain["turn"] == num_responses - 1]
+    retrieved = sum(gain["retrieved"] for gain in gains)
+    if retrieved and sum(gain["novel"] for gain in gains) / retrieved < state.get('min_source_gain', 0.1):
+        return 'save_interview'
+
     # This router is run after each question - answer pair 
     # Get the last question asked to check if it signals the end of discussion
     last_question = messages[-2]
@@ -345,12 +417,13 @@ def write_section(state: InterviewState):
 
     # Get state
     interview = state["interview"]
-    context = state["context"]
+    context = render_documents(state["context"], state.get('section_context_tokens', 8000))
     analyst = state["analyst"]
    
     # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
     system_message = section_writer_instructions.format(focus=analyst.description)
-    section = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Use this source to write your section: {context}")]) 
+    with scheduler.limit("openai"):
+        section = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Use this source to write your section: {context}")]) 
                 
     # Append it to state
     return {"sections": [section.content]}
@@ -358,22 +431,35 @@ def write_section(state: InterviewState):
 # Add nodes and edges 
 interview_builder = StateGraph(InterviewState)
 interview_builder.add_node("ask_question", generate_question)
-interview_builder.add_node("search_web", search_web)
-interview_builder.add_node("search_wikipedia", search_wikipedia)
+interview_builder.add_node("plan_queries", plan_queries)
+for retriever in enabled_retrievers():
+    interview_builder.add_node(*retriever_nodes[retriever])
 interview_builder.add_node("answer_question", generate_answer)
 interview_builder.add_node("save_interview", save_interview)
 interview_builder.add_node("write_section", write_section)
 
 # Flow
 interview_builder.add_edge(START, "ask_question")
-interview_builder.add_edge("ask_question", "search_web")
-interview_builder.add_edge("ask_question", "search_wikipedia")
-interview_builder.add_edge("search_web", "answer_question")
-interview_builder.add_edge("search_wikipedia", "answer_question")
+interview_builder.add_edge("ask_question", "plan_queries")
+for retriever in enabled_retrievers():
+    interview_builder.add_edge("plan_queries", retriever_nodes[retriever][0])
+    interview_builder.add_edge(retriever_nodes[retriever][0], "answer_question")
 interview_builder.add_conditional_edges("answer_question", route_messages,['ask_question','save_interview'])
 interview_builder.add_edge("save_interview", "write_section")
 interview_builder.add_edge("write_section", END)
 
+interview_graph = interview_builder.compile()
+
+# Compiled without a checkpointer, so interviews can run side by side within one node
+interview_runner = interview_builder.compile(checkpointer=False)
+
+def interview_input(analyst: Analyst, topic: str) -> dict:
+
+    """ Initial state of one interview """
+
+    return {"analyst": analyst,
+            "messages": [HumanMessage(content=f"So you said you were writing an article on {topic}?")]}
+
 def initiate_all_interviews(state: ResearchGraphState):
 
     """ Conditional edge to initiate all interviews via Send() API or return to create_analysts """    
@@ -384,14 +470,14 @@ def initiate_all_interviews(state: ResearchGraphState):
         # Return to create_analysts
         return "create_analysts"
 
+    # Or run them in one node that folds each section into the draft as it arrives
+    if state.get("incremental_report"):
+        return "conduct_interviews_incrementally"
+
     # Otherwise kick off interviews in parallel via Send() API
     else:
         topic = state["topic"]
-        return [Send("conduct_interview", {"analyst": analyst,
-                                           "messages": [HumanMessage(
-                                               content=f"So you said you were writing an article on {topic}?"
-                                           )
-                                                       ]}) for analyst in state["analysts"]]
+        return [Send("conduct_interview", interview_input(analyst, topic)) for analyst in state["analysts"]]
 
 # Write a report based on the interviews
 report_writer_instructions = """You are a technical writer creating a report on this overall topic: 
@@ -428,21 +514,116 @@ Here are the memos from your analysts to build your report from:
 
 {context}"""
 
+# Fold newly arrived memos into the report written from the earlier ones
+report_fold_instructions = """You are a technical writer creating a report on this overall topic: 
+
+{topic}
+
+You have a team of analysts. Each analyst conducted an interview with an expert on a specific sub-topic and wrote up their finding into a memo.
+
+The memos arrive as the interviews finish. Here is the report you have written from the memos that arrived so far: 
+
+{draft}
+
+Your task: 
+
+1. You will be given the memos that arrived since.
+2. Think carefully about the insights from each new memo.
+3. Fold them into the report: keep everything the report already says and tie the new insights into its single narrative.
+4. Keep the consolidated list of sources, adding the sources of the new memos.
+
+To format your report:
+ 
+1. Use markdown formatting. 
+2. Include no pre-amble for the report.
+3. Use no sub-heading. 
+4. Start your report with a single title header: ## Insights
+5. Do not mention any analyst names in your report.
+6. Preserve any citations in the report and the memos, which will be annotated in brackets, for example [1] or [2]. Renumber the citations of the new memos so they follow on from the report's.
+7. Keep the consolidated list of sources in a Sources section with the `## Sources` header.
+8. List your sources in order and do not repeat.
+
+[1] Source 1
+[2] Source 2
+
+Here are the new memos to fold into your report: 
+
+{context}"""
+
+def report_messages(topic: str, draft: str, sections: list) -> list:
+
+    """ Prompt to write the report body from the sections, or to fold them into the draft """
+
+    # Concat all sections together
+    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
+
+    if draft:
+        system_message = report_fold_instructions.format(topic=topic, draft=draft, context=formatted_str_sections)
+        return [SystemMessage(content=system_message)]+[HumanMessage(content=f"Fold these memos into the report.")]
+    system_message = report_writer_instructions.format(topic=topic, context=formatted_str_sections)
+    return [SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")]
+
+def conduct_interviews_incrementally(state: ResearchGraphState, config: RunnableConfig):
+
+    """ Node to run all interviews at once, folding sections into the draft as they arrive """
+
+    topic = state["topic"]
+    analysts = state["analysts"]
+    sections, draft, folded, failed = [], "", 0, []
+    if not analysts:
+        return {"sections": sections, "draft": draft, "folded_sections": folded}
+
+    with ContextThreadPoolExecutor(max_workers=len(analysts)) as pool:
+        pending = {pool.submit(interview_runner.invoke, interview_input(analyst, topic), config): analyst
+                   for analyst in analysts}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                analyst = pending.pop(future)
+                # A failed interview leaves its section out of the report instead of failing it
+                if future.exception() is not None:
+                    logger.error("Interview of %s failed: %r", analyst.name, future.exception())
+                    failed.append(future.exception())
+                    continue
+                sections += future.result()["sections"]
+
+            # write_report folds the last arrivals. Interviews finishing during
+            # a fold are folded together by the next one
+            if pending and len(sections) > folded:
+                with scheduler.limit("openai"):
+                    draft = llm.invoke(report_messages(topic, draft, sections[folded:])).content
+                folded = len(sections)
+
+    # Without a single section there is nothing to report on
+    if not sections and failed:
+        raise failed[0]
+    return {"sections": sections, "draft": draft, "folded_sections": folded}
+
+def generate_report_section(section: str, messages: list) -> str:
+
+    """ Generate one part of the final report, streaming its tokens as custom stream events """
+
+    # Callers of report_stream.stream_report see the tokens in report order
+    chunks = []
+    with scheduler.limit("openai"):
+        for chunk in llm.stream(messages):
+            report_stream.write_token(section, chunk.content)
+            chunks.append(chunk.content)
+    content = "".join(chunks)
+    report_stream.write_section(section, content)
+    return content
+
 def write_report(state: ResearchGraphState):
 
     """ Node to write the final report body """
 
-    # Full set of sections
-    sections = state["sections"]
+    # Sections not yet folded into the draft; all of them unless incremental
+    sections = state["sections"][state.get("folded_sections", 0):]
     topic = state["topic"]
 
-    # Concat all sections together
-    formatted_str_sections = "\n\n".join([f"{section}" for section in sections])
-    
     # Summarize the sections into a final report
-    system_message = report_writer_instructions.format(topic=topic, context=formatted_str_sections)    
-    report = llm.invoke([SystemMessage(content=system_message)]+[HumanMessage(content=f"Write a report based upon these memos.")]) 
-    return {"content": report.content}
+    report = generate_report_section("content", report_messages(topic, state.get("draft", ""), sections))
+    return {"content": report}
 
 # Write the introduction or conclusion
 intro_conclusion_instructions = """You are a technical writer finishing a report on {topic}
@@ -481,8 +662,8 @@ def write_introduction(state: ResearchGraphState):
     # Summarize the sections into a final report
     
     instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
-    intro = llm.invoke([instructions]+[HumanMessage(content=f"Write the report introduction")]) 
-    return {"introduction": intro.content}
+    intro = generate_report_section("introduction", [instructions]+[HumanMessage(content=f"Write the report introduction")]) 
+    return {"introduction": intro}
 
 def write_conclusion(state: ResearchGraphState):
 
@@ -498,8 +679,8 @@ def write_conclusion(state: ResearchGraphState):
     # Summarize the sections into a final report
     
     instructions = intro_conclusion_instructions.format(topic=topic, formatted_str_sections=formatted_str_sections)    
-    conclusion = llm.invoke([instructions]+[HumanMessage(content=f"Write the report conclusion")]) 
-    return {"conclusion": conclusion.content}
+    conclusion = generate_report_section("conclusion", [instructions]+[HumanMessage(content=f"Write the report conclusion")]) 
+    return {"conclusion": conclusion}
 
 def finalize_report(state: ResearchGraphState):
 
@@ -520,13 +701,15 @@ def finalize_report(state: ResearchGraphState):
     final_report = state["introduction"] + "\n\n---\n\n" + content + "\n\n---\n\n" + state["conclusion"]
     if sources is not None:
         final_report += "\n\n## Sources\n" + sources
+    report_stream.write_finished(final_report)
     return {"final_report": final_report}
 
 # Add nodes and edges 
 builder = StateGraph(ResearchGraphState)
 builder.add_node("create_analysts", create_analysts)
 builder.add_node("human_feedback", human_feedback)
-builder.add_node("conduct_interview", interview_builder.compile())
+builder.add_node("conduct_interview", interview_graph)
+builder.add_node("conduct_interviews_incrementally", conduct_interviews_incrementally)
 builder.add_node("write_report",write_report)
 builder.add_node("write_introduction",write_introduction)
 builder.add_node("write_conclusion",write_conclusion)
@@ -535,10 +718,12 @@ builder.add_node("finalize_report",finalize_report)
 # Logic
 builder.add_edge(START, "create_analysts")
 builder.add_edge("create_analysts", "human_feedback")
-builder.add_conditional_edges("human_feedback", initiate_all_interviews, ["create_analysts", "conduct_interview"])
-builder.add_edge("conduct_interview", "write_report")
-builder.add_edge("conduct_interview", "write_introduction")
-builder.add_edge("conduct_interview", "write_conclusion")
+builder.add_conditional_edges("human_feedback", initiate_all_interviews,
+                              ["create_analysts", "conduct_interview", "conduct_interviews_incrementally"])
+for interviews in ["conduct_interview", "conduct_interviews_incrementally"]:
+    builder.add_edge(interviews, "write_report")
+    builder.add_edge(interviews, "write_introduction")
+    builder.add_edge(interviews, "write_conclusion")
 builder.add_edge(["write_conclusion", "write_report", "write_introduction"], "finalize_report")
 builder.add_edge("finalize_report", END)
 
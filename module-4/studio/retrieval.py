@@ -0,0 +1,94 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from local_corpus import has_index
+
+logger = logging.getLogger(__name__)
+
+### Bounded retrieval
+
+@dataclass(frozen=True)
+class RetrievalPolicy:
+    """How long a retriever waits for its searches, in seconds.
+
+    After `timeout` the retriever goes on with the results that have arrived.
+    After `hedge_after`, a search still running is sent again and whichever copy
+    finishes first is used. None disables either.
+    """
+    timeout: Optional[float] = 15.0
+    hedge_after: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, retriever: str) -> "RetrievalPolicy":
+        """Policy configured by RETRIEVAL_TIMEOUT and RETRIEVAL_HEDGE_AFTER, each
+        overridable per retriever, e.g. RETRIEVAL_TIMEOUT_WIKIPEDIA; 0 disables."""
+        def seconds(name: str, default: Optional[float]) -> Optional[float]:
+            value = os.environ.get(f"{name}_{retriever.upper()}", os.environ.get(name))
+            if value is None:
+                return default
+            return float(value) or None
+        return cls(seconds("RETRIEVAL_TIMEOUT", cls.timeout), seconds("RETRIEVAL_HEDGE_AFTER", cls.hedge_after))
+
+def enabled_retrievers() -> list[str]:
+    """Retrievers named in RESEARCH_RETRIEVERS, e.g. "local" to research offline.
+
+    By default the web and Wikipedia, plus the local corpus once it is indexed.
+    """
+    names = os.environ.get("RESEARCH_RETRIEVERS")
+    if names:
+        return [name.strip() for name in names.split(",") if name.strip()]
+    return ["tavily", "wikipedia"] + (["local"] if has_index() else [])
+
+# Searches that time out cannot be cancelled; they finish here in the background,
+# and the search cache still stores their results for the next turn
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="retrieval")
+
+def retrieve(search: Callable[[str], Any], queries: list[str],
+             policy: RetrievalPolicy) -> tuple[dict[str, Any], list[str]]:
+    """Run `search` for every query at once, within the policy's deadline.
+
+    Returns the results by query and the queries that missed out: those still
+    running at the deadline, and those whose search failed (unless a hedged copy
+    of it is still running). Failures are logged, so one bad query does not cost
+    the results of the others.
+    """
+    start = time.monotonic()
+    attempts: dict[Future, str] = {}
+    for query in queries:
+        attempts[_pool.submit(search, query)] = query
+
+    results, failed, hedged = {}, set(), False
+    while len(results) + len(failed) < len(set(queries)):
+        elapsed = time.monotonic() - start
+        if policy.timeout is not None and elapsed >= policy.timeout:
+            break
+        if policy.hedge_after is not None and not hedged and elapsed >= policy.hedge_after:
+            hedged = True
+            for query in set(attempts.values()) - results.keys() - failed:
+                attempts[_pool.submit(search, query)] = query
+
+        # Wake up at the deadline or when it is time to hedge
+        wakeups = [policy.timeout] if policy.timeout is not None else []
+        if policy.hedge_after is not None and not hedged:
+            wakeups.append(policy.hedge_after)
+        timeout = max(0.0, min(wakeups) - elapsed) if wakeups else None
+        done, _ = wait(list(attempts), timeout=timeout, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            query = attempts.pop(future)
+            if query in results or query in failed:
+                continue
+            if future.exception() is None:
+                results[query] = future.result()
+            elif query not in attempts.values():
+                logger.warning("Search for %r failed: %r", query, future.exception())
+                failed.add(query)
+
+    # Copies still queued for queries already settled are not needed
+    for future in attempts:
+        future.cancel()
+    return results, [query for query in dict.fromkeys(queries) if query not in results]
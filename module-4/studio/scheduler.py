@@ -0,0 +1,58 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+### Request scheduler
+
+def parse_rate_limits(spec: str) -> dict[str, tuple[float, float]]:
+    """Parse "openai=5:10,tavily=2" into {provider: (requests per second, burst)}.
+
+    The burst defaults to one request.
+    """
+    limits = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        provider, _, rate = part.partition("=")
+        per_second, _, burst = rate.partition(":")
+        limits[provider.strip()] = (float(per_second), float(burst or 1))
+    return limits
+
+class Scheduler:
+    """Global in-flight limit and per-provider token buckets for LLM and search calls.
+
+    Every call runs inside `limit(provider)`. The call first waits for a token
+    from the provider's bucket, if one is configured, so a throttled provider
+    does not hold slots that other providers could use. It then waits for one of
+    `max_in_flight` slots shared by all providers. Interviews fanned out with Send
+    queue here instead of stampeding the providers, so throughput stays steady
+    and provider rate-limit errors do not turn into retry storms.
+    """
+
+    def __init__(self, max_in_flight: int = 8, rate_limits: Optional[dict[str, tuple[float, float]]] = None):
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._buckets = {
+            provider: InMemoryRateLimiter(requests_per_second=per_second, max_bucket_size=burst,
+                                          check_every_n_seconds=min(0.1, 1 / per_second))
+            for provider, (per_second, burst) in (rate_limits or {}).items()
+        }
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        """Scheduler configured by RESEARCH_MAX_IN_FLIGHT and RESEARCH_RATE_LIMITS."""
+        return cls(int(os.environ.get("RESEARCH_MAX_IN_FLIGHT", 8)),
+                   parse_rate_limits(os.environ.get("RESEARCH_RATE_LIMITS", "openai=5:10,tavily=2:4,wikipedia=2:4")))
+
+    @contextmanager
+    def limit(self, provider: str) -> Iterator[None]:
+        """Take a token from the provider's bucket, then hold an in-flight slot for one call."""
+        bucket = self._buckets.get(provider)
+        if bucket is not None:
+            bucket.acquire()
+        with self._slots:
+            yield
+
+# Shared by every graph in this process
+scheduler = Scheduler.from_env()
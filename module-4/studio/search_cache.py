@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from langchain_core.documents import Document
+
+from langchain_community.document_loaders import WikipediaLoader
+from langchain_community.tools.tavily_search import TavilySearchResults
+
+from scheduler import scheduler
+
+### Search result cache
+
+# Words dropped from queries before they are used as cache keys
+STOPWORDS = frozenset("""a an and are as at be by can do does for from how in is it of on or
+the to vs what when where which who why with""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def normalize_query(query: str) -> str:
+    """Lowercase the query and keep its words minus punctuation and stopwords, in order."""
+    return " ".join(word for word in _WORD_RE.findall(query.lower()) if word not in STOPWORDS)
+
+class SearchCache:
+    """Search results on local disk in SQLite, shared by threads and processes.
+
+    Entries are keyed by provider, normalized query and result count, so
+    near-identical queries from different analysts share one search. Entries
+    older than `ttl` seconds are never served. When the stored results exceed
+    `max_bytes`, the least recently used entries are evicted. With `offline`
+    set, misses raise LookupError instead of searching, so replays run only on
+    cached results.
+    """
+
+    def __init__(self, path: str, ttl: float = 7 * 24 * 3600, max_bytes: int = 256 * 2**20,
+                 offline: bool = False):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS search_results (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                k INTEGER NOT NULL,
+                results TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS search_results_accessed_at ON search_results (accessed_at)")
+
+    @classmethod
+    def from_env(cls) -> "SearchCache":
+        """Cache configured by SEARCH_CACHE_PATH, SEARCH_CACHE_TTL (seconds),
+        SEARCH_CACHE_MAX_MB and SEARCH_CACHE_OFFLINE."""
+        path = os.environ.get("SEARCH_CACHE_PATH") or os.path.join(
+            os.path.expanduser("~"), ".cache", "langchain-academy", "search_cache.sqlite")
+        return cls(path,
+                   ttl=float(os.environ.get("SEARCH_CACHE_TTL", 7 * 24 * 3600)),
+                   max_bytes=int(float(os.environ.get("SEARCH_CACHE_MAX_MB", 256)) * 2**20),
+                   offline=os.environ.get("SEARCH_CACHE_OFFLINE", "").lower() in ("1", "true", "yes"))
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; SQLite handles locking between processes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return conn
+
+    @staticmethod
+    def _key(provider: str, query: str, k: int) -> str:
+        return hashlib.sha256(f"{provider}\x1f{normalize_query(query)}\x1f{k}".encode()).hexdigest()
+
+    def get(self, provider: str, query: str, k: int) -> Optional[Any]:
+        """Cached results for the query, or None if missing or expired."""
+        key = self._key(provider, query, k)
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT results, created_at FROM search_results WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            return None
+        conn.execute("UPDATE search_results SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, provider: str, query: str, k: int, results: Any) -> None:
+        """Store results, then evict expired and least recently used entries over the size limit."""
+        data = json.dumps(results, default=str)
+        now = time.time()
+        conn = self._connect()
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                             (self._key(provider, query, k), provider, normalize_query(query), k,
+                              data, len(data), now, now))
+                conn.execute("DELETE FROM search_results WHERE created_at < ?", (now - self.ttl,))
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM search_results").fetchone()[0]
+                if total > self.max_bytes:
+                    # Evict down to 90% of the limit so every put does not evict again
+                    excess = total - int(self.max_bytes * 0.9)
+                    keys, freed = [], 0
+                    for key, size in conn.execute("SELECT key, size FROM search_results ORDER BY accessed_at"):
+                        if freed >= excess:
+                            break
+                        keys.append((key,))
+                        freed += size
+                    conn.executemany("DELETE FROM search_results WHERE key = ?", keys)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def cached(self, provider: str, query: str, k: int, search: Callable[[], Any]) -> Any:
+        """Return cached results, or run `search` and cache what it returns."""
+        results = self.get(provider, query, k)
+        if results is not None:
+            return results
+        if self.offline:
+            raise LookupError(f"No cached {provider} results for {query!r} (SEARCH_CACHE_OFFLINE is set)")
+        results = search()
+        # Tools report some failures as a string instead of raising; never cache those
+        if isinstance(results, list):
+            self.put(provider, query, k, results)
+        return results
+
+# Shared by every graph in this process
+search_cache = SearchCache.from_env()
+
+def _search_tavily(query: str, max_results: int) -> list[dict]:
+    with scheduler.limit("tavily"):
+        return TavilySearchResults(max_results=max_results).invoke(query)
+
+def _search_wikipedia(query: str, load_max_docs: int) -> list[dict]:
+    with scheduler.limit("wikipedia"):
+        docs = WikipediaLoader(query=query, load_max_docs=load_max_docs).load()
+    return [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+# Only searches that miss the cache are scheduled against the rate limits
+def tavily_search(query: str, max_results: int = 3) -> list[dict]:
+    """Tavily web search results (dicts with url and content), served from the cache when possible."""
+    return search_cache.cached("tavily", query, max_results, lambda: _search_tavily(query, max_results))
+
+def wikipedia_search(query: str, load_max_docs: int = 2) -> list[Document]:
+    """Wikipedia pages as Documents, served from the cache when possible."""
+    docs = search_cache.cached("wikipedia", query, load_max_docs, lambda: _search_wikipedia(query, load_max_docs))
+    return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in docs]
@@ -1,13 +1,17 @@
 import uuid
+from dataclasses import dataclass
 from datetime import datetime
 
 from pydantic import BaseModel, Field
 
 from trustcall import create_extractor
 
-from typing import Literal, Optional, TypedDict
+from typing import Any, Literal, Optional, TypedDict
 
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import ensure_config, merge_configs
 from langchain_core.messages import merge_message_runs
 from langchain_core.messages import SystemMessage, HumanMessage
 
@@ -22,62 +26,75 @@ import configuration
 
 ## Utilities 
 
-# Inspect the tool calls for Trustcall
-class Spy:
-    def __init__(self):
-        self.called_tools = []
-
-    def __call__(self, run):
-        q = [run]
-        while q:
-            r = q.pop()
-            if r.child_runs:
-                q.extend(r.child_runs)
-            if r.run_type == "chat_model":
-                self.called_tools.append(
-                    r.outputs["generations"][0][0]["message"]["kwargs"]["tool_calls"]
-                )
-
-# Extract information from tool calls for both patches and new memories in Trustcall
-def extract_tool_info(tool_calls, schema_name="Memory"):
-    """Extract information from tool calls for both patches and new memories.
+# Capture the changes Trustcall makes, as the chat model returns its tool calls
+@dataclass
+class MemoryChange:
+    """One change proposed by Trustcall for a memory document."""
+    type: Literal["update", "no_update", "new"]
+    value: Any = None
+    doc_id: Optional[str] = None
+    planned_edits: Optional[str] = None
+
+class ChangeCapture(BaseCallbackHandler):
+    """Record Trustcall's PatchDoc and insert tool calls as structured changes.
+
+    Attach per call by adding it to the inherited config
+    (`config=merge_configs(ensure_config(), {"callbacks": [capture]})`); a bare
+    `{"callbacks": [capture]}` would replace the node's callbacks and drop the
+    call from the run's trace. Each chat model call is inspected when it
+    finishes, straight from the generated message, so no run tree is retained
+    or walked afterwards.
+    """
+
+    run_inline = True
+
+    def __init__(self, schema_name="Memory"):
+        self.schema_name = schema_name
+        self.changes: list[MemoryChange] = []
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                for call in getattr(message, "tool_calls", None) or []:
+                    if call['name'] == 'PatchDoc':
+                        args = call['args']
+                        # Check if there are any patches
+                        if args.get('patches'):
+                            self.changes.append(MemoryChange('update', args['patches'][0]['value'],
+                                                             args['json_doc_id'], args['planned_edits']))
+                        else:
+                            # Handle case where no changes were needed
+                            self.changes.append(MemoryChange('no_update', None,
+                                                             args['json_doc_id'], args['planned_edits']))
+                    elif call['name'] == self.schema_name:
+                        self.changes.append(MemoryChange('new', call['args']))
+
+# Format the captured changes for the tool message returned to the chatbot
+def format_changes(changes, schema_name="Memory"):
+    """Describe patches and new memories made by Trustcall as a single string.
     
     Args:
-        tool_calls: List of tool calls from the model
+        changes: MemoryChange records collected by ChangeCapture
         schema_name: Name of the schema tool (e.g., "Memory", "ToDo", "Profile")
     """
-
-    # Initialize list of changes
-    changes = []
-    
-    for call_group in tool_calls:
-        for call in call_group:
-            if call['name'] == 'PatchDoc':
-                changes.append({
-                    'type': 'update',
-                    'doc_id': call['args']['json_doc_id'],
-                    'planned_edits': call['args']['planned_edits'],
-                    'value': call['args']['patches'][0]['value']
-                })
-            elif call['name'] == schema_name:
-                changes.append({
-                    'type': 'new',
-                    'value': call['args']
-                })
-
-    # Format results as a single string
     result_parts = []
     for change in changes:
-        if change['type'] == 'update':
+        if change.type == 'update':
             result_parts.append(
-                f"Document {change['doc_id']} updated:\n"
-                f"Plan: {change['planned_edits']}\n"
-                f"Added content: {change['value']}"
+                f"Document {change.doc_id} updated:\n"
+                f"Plan: {change.planned_edits}\n"
+                f"Added content: {change.value}"
+            )
+        elif change.type == 'no_update':
+            result_parts.append(
+                f"Document {change.doc_id} unchanged:\n"
+                f"{change.planned_edits}"
             )
         else:
             result_parts.append(
                 f"New {schema_name} created:\n"
-                f"Content: {change['value']}"
+                f"Content: {change.value}"
             )
     
     return "\n\n".join(result_parts)
@@ -303,8 +320,8 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
     TRUSTCALL_INSTRUCTION_FORMATTED=TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
     updated_messages=list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state["messages"][:-1]))
 
-    # Initialize the spy for visibility into the tool calls made by Trustcall
-    spy = Spy()
+    # Capture the changes made by Trustcall as its tool calls come back
+    capture = ChangeCapture(tool_name)
     
     # Create the Trustcall extractor for updating the ToDo list 
     todo_extractor = create_extractor(
@@ -312,11 +329,12 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
     tools=[ToDo],
     tool_choice=tool_name,
     enable_inserts=True
-    ).with_listeners(on_end=spy)
+    )
 
-    # Invoke the extractor
+    # Invoke the extractor, adding the capture to the node's callbacks for this call only
     result = todo_extractor.invoke({"messages": updated_messages, 
-                                         "existing": existing_memories})
+                                         "existing": existing_memories},
+                                   config=merge_configs(ensure_config(), {"callbacks": [capture]}))
 
     # Save save the memories from Trustcall to the store
     for r, rmeta in zip(result["responses"], result["response_metadata"]):
@@ -329,7 +347,7 @@ def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore)
     tool_calls = state['messages'][-1].tool_calls
 
     # Extract the changes made by Trustcall and add the the ToolMessage returned to task_mAIstro
-    todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
+    todo_update_msg = format_changes(capture.changes, tool_name)
     return {"messages": [{"role": "tool", "content": todo_update_msg, "tool_call_id":tool_calls[0]['id']}]}
 
 def update_instructions(state: MessagesState, config: RunnableConfig, store: BaseStore):
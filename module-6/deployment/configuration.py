@@ -6,12 +6,28 @@ from langchain_core.runnables import RunnableConfig
 from typing_extensions import Annotated
 from dataclasses import dataclass
 
+def _coerce(field_type: Any, value: Any) -> Any:
+    """Convert values coming from environment variables to the field type."""
+    if not isinstance(value, str):
+        return value
+    if field_type is bool:
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    if field_type in (int, float):
+        return field_type(value)
+    return value
+
 @dataclass(kw_only=True)
 class Configuration:
     """The configurable fields for the chatbot."""
     user_id: str = "default-user"
     todo_category: str = "general" 
     task_maistro_role: str = "You are a helpful task management assistant. You help you create, organize, and manage the user's ToDo list."
+    parallel_memory_updates: bool = False # Let the model request several memory updates at once and run them concurrently
+    background_memory_updates: bool = False # Reply right away and run memory extraction in a background worker pool
+    todo_token_budget: int = 1000 # Approximate token budget for the ToDo list in the system prompt
+    todo_relevance_top_k: int = 0 # Only show the model the k ToDos most relevant to the latest message (0 shows all)
+    cold_todo_after_days: float = 7.0 # Done ToDos untouched this long move to the archive namespace; archived ones move right away
+    cold_todo_restore_threshold: float = 0.35 # Content-word similarity to the latest message that shows Trustcall an archived ToDo
 
     @classmethod
     def from_runnable_config(
@@ -22,7 +38,7 @@ class Configuration:
             config["configurable"] if config and "configurable" in config else {}
         )
         values: dict[str, Any] = {
-            f.name: os.environ.get(f.name.upper(), configurable.get(f.name))
+            f.name: _coerce(f.type, os.environ.get(f.name.upper(), configurable.get(f.name)))
             for f in fields(cls)
             if f.init
         }
@@ -0,0 +1,190 @@
+import argparse
+import json
+import logging
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+from pydantic import BaseModel, Field
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langgraph.store.base import BaseStore, Item, PutOp, SearchOp
+
+import postgres_store
+import task_maistro
+from memory_cache import memory_namespace
+from redis_cache import cached_store
+from runnable_registry import registry
+from task_maistro import Profile, ToDo
+from todo_repository import OPEN_STATUSES, TodoRepository
+from todo_tiering import TieringPolicy, TodoTiers
+
+logger = logging.getLogger(__name__)
+
+## Bulk memory consolidation
+# Off-peak job that walks every user's profile and ToDo namespaces, merges duplicate
+# ToDos, moves stale done items to the archive and normalizes the profile, so the
+# memories read on every interactive turn stay small:
+#
+#   python consolidate.py --concurrency 8 --users-per-batch 32 --stale-days 14
+
+class MergedToDo(BaseModel):
+    """One ToDo item that replaces a group of duplicate items"""
+    keys: list[str] = Field(description="Keys of the duplicate ToDo items this item replaces (at least two)")
+    todo: ToDo = Field(description="The merged ToDo item, keeping every distinct solution and the earliest deadline")
+
+class Consolidation(BaseModel):
+    """Consolidated memories of one user"""
+    profile: Optional[Profile] = Field(
+        description="The profile with duplicates removed and values normalized, or null if there is no profile",
+        default=None
+    )
+    merged_todos: list[MergedToDo] = Field(
+        description="One entry per group of duplicate ToDo items; leave out items that have no duplicate",
+        default_factory=list
+    )
+
+CONSOLIDATION_INSTRUCTION = """You are consolidating the long-term memory of a task management assistant.
+
+Normalize the user profile: remove duplicate connections and interests, use consistent capitalization and keep every distinct fact. Do not invent information.
+
+Find ToDo items that describe the same task and merge each group into one item.
+
+<profile>
+{profile}
+</profile>
+
+<todos>
+{todos}
+</todos>"""
+
+@dataclass
+class ConsolidationStats:
+    """Counts reported at the end of a run."""
+    users: int = 0
+    prompted: int = 0
+    failed: int = 0
+    profiles_normalized: int = 0
+    todos_merged: int = 0
+    todos_archived: int = 0
+
+def iter_users(store: BaseStore, page_size: int = 1000) -> Iterator[tuple[str, str]]:
+    """Yield every (todo_category, user_id) with a ToDo or profile namespace, once each."""
+    seen = set()
+    for memory_type in ("todo", "profile"):
+        offset = 0
+        while True:
+            namespaces = store.list_namespaces(prefix=(memory_type,), max_depth=3, limit=page_size, offset=offset)
+            for namespace in namespaces:
+                if len(namespace) == 3 and namespace[1:] not in seen:
+                    seen.add(namespace[1:])
+                    yield namespace[1], namespace[2]
+            if len(namespaces) < page_size:
+                break
+            offset += page_size
+
+def _chunks(users: Iterator[tuple[str, str]], size: int) -> Iterator[list[tuple[str, str]]]:
+    chunk = []
+    for user in users:
+        chunk.append(user)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def consolidation_prompt(profile: Optional[Item], todos: list[Item]) -> list:
+    """Prompt asking the model to normalize the profile and merge duplicate ToDos."""
+    todo_lines = "\n".join(f"{item.key}: {json.dumps(item.value, default=str)}" for item in todos)
+    return [SystemMessage(content=CONSOLIDATION_INSTRUCTION.format(
+                profile=json.dumps(profile.value, default=str) if profile else None, todos=todo_lines or None)),
+            HumanMessage(content="Consolidate these memories")]
+
+def consolidation_ops(todos: TodoRepository, profile: Optional[Item], active: list[Item],
+                      result: Consolidation, stats: ConsolidationStats) -> list[PutOp]:
+    """Store writes applying one user's consolidation; invalid merges are skipped."""
+    ops = []
+    if profile is not None and result.profile is not None:
+        normalized = result.profile.model_dump(mode="json")
+        if normalized != profile.value:
+            ops.append(PutOp(profile.namespace, profile.key, normalized))
+            stats.profiles_normalized += 1
+
+    # Each merge keeps the key of its first item and deletes the others
+    active_keys = {item.key for item in active}
+    merged_keys = set()
+    for merge in result.merged_todos:
+        keys = list(dict.fromkeys(merge.keys))
+        if len(keys) < 2 or not set(keys) <= active_keys or merged_keys & set(keys):
+            logger.warning("Skipping invalid merge of %s for %s", keys, todos.namespace)
+            continue
+        merged_keys.update(keys)
+        ops += todos.put_ops({keys[0]: merge.todo.model_dump(mode="json")})
+        ops += todos.delete_ops(keys[1:])
+        stats.todos_merged += len(keys) - 1
+    return ops
+
+def consolidate(store: BaseStore, concurrency: int = 8, users_per_batch: int = 32,
+                stale_days: float = 14, max_items: int = 500, dry_run: bool = False) -> ConsolidationStats:
+    """Consolidate the memories of every user, `users_per_batch` users at a time.
+
+    Each batch of users is read with one store batch, prompted with one
+    `model.batch` call running at most `concurrency` requests at once, and written
+    back with one store batch. Done items untouched for `stale_days`, and archived
+    ones, move to the cold tier.
+    """
+    stats = ConsolidationStats()
+    consolidator = registry.structured_output(task_maistro.model, Consolidation)
+    policy = TieringPolicy(done_after_days=stale_days)
+
+    for users in _chunks(iter_users(store), users_per_batch):
+        stats.users += len(users)
+        reads = [SearchOp(memory_namespace(memory_type, todo_category, user_id), limit=max_items)
+                 for todo_category, user_id in users for memory_type in ("profile", "todo")]
+        results = store.batch(reads)
+
+        ops, prompts, pending = [], [], []
+        for (todo_category, user_id), profiles, items in zip(users, results[::2], results[1::2]):
+            tiers = TodoTiers(store, todo_category, user_id, policy)
+            todos = tiers.hot
+            profile = profiles[0] if profiles else None
+
+            # Move finished items out of the hot tier; no model call needed
+            cold, moved = tiers.cold_ops(items)
+            ops += cold
+            stats.todos_archived += len(moved)
+
+            # Only prompt when there is something the model can consolidate
+            active = [item for item in items if item.key not in moved]
+            if profile is not None or len([i for i in active if i.value.get("status") in OPEN_STATUSES]) > 1:
+                prompts.append(consolidation_prompt(profile, active))
+                pending.append((todos, profile, active))
+
+        stats.prompted += len(prompts)
+        responses = consolidator.batch(prompts, config={"max_concurrency": concurrency}, return_exceptions=True)
+        for (todos, profile, active), response in zip(pending, responses):
+            if isinstance(response, Exception):
+                logger.error("Consolidation failed for %s: %s", todos.namespace, response)
+                stats.failed += 1
+                continue
+            ops += consolidation_ops(todos, profile, active, response, stats)
+
+        if ops and not dry_run:
+            store.batch(ops)
+    return stats
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consolidate the long-term memories of every task_maistro user")
+    parser.add_argument("--concurrency", type=int, default=8, help="model requests running at once")
+    parser.add_argument("--users-per-batch", type=int, default=32, help="users read, prompted and written together")
+    parser.add_argument("--stale-days", type=float, default=14, help="move done items untouched for this long to the archive")
+    parser.add_argument("--max-items", type=int, default=500, help="ToDo items read per user")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    store = postgres_store.get_store()
+    if store is None:
+        raise SystemExit("Set MEMORY_STORE_URI to the Postgres database holding the memories")
+    # Write through the Redis cache, if any, so servers stop serving the old memories
+    print(consolidate(cached_store(store), args.concurrency, args.users_per_batch,
+                      args.stale_days, args.max_items, args.dry_run))
@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Optional
+from uuid import UUID
+
+import numpy as np
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.store.base import BaseStore, GetOp, ListNamespacesOp, Op, PutOp, Result, SearchOp
+from langgraph.store.memory import InMemoryStore
+
+# task_maistro builds a ChatOpenAI client at import; the load test never calls it
+os.environ.setdefault("OPENAI_API_KEY", "load-test")
+
+import postgres_store
+import task_maistro
+
+## Offline load test for task_maistro
+# Drives the graph with many simulated users and threads against a scripted local
+# chat model, and reports throughput and per node / per store operation latency:
+#
+#   python load_test.py --users 50 --threads-per-user 2 --turns 4 --concurrency 16 --model-latency 0.05
+
+# Scripted user turns, with the memory updates the fake model requests for each
+USER_TURNS = [
+    ("Hi, I'm {user}. I live in Lisbon and I work as a nurse.", ("user",)),
+    ("I need to renew my passport before the end of the month.", ("todo",)),
+    ("When you add ToDos, always suggest at least two solutions.", ("instructions",)),
+    ("Also book a dentist appointment and buy a birthday present for my sister.", ("todo", "user")),
+    ("What is on my list right now?", ()),
+    ("I finished the passport renewal, and I started running on weekends.", ("todo", "user")),
+]
+
+_INSTANCE_RE = re.compile(r'<instance id=(\S+?) schema_type="(\w+)">')
+
+def _text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+
+class ScriptedChatModel(BaseChatModel):
+    """Deterministic stand-in for ChatOpenAI with a configurable latency per call.
+
+    Answers task_mAIstro with UpdateMemory calls scripted in USER_TURNS, the
+    Trustcall extractors with PatchDoc calls for existing documents plus new
+    ToDo / Profile calls, and the instructions update with plain text.
+    """
+    latency: float = 0.0
+    tool_names: tuple[str, ...] = ()
+    parallel_tool_calls: bool = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        names = tuple(convert_to_openai_tool(tool)["function"]["name"] for tool in tools)
+        return self.model_copy(update={"tool_names": names,
+                                       "parallel_tool_calls": kwargs.get("parallel_tool_calls", True) is not False})
+
+    def _respond(self, messages: list[BaseMessage]) -> AIMessage:
+        last_user = next((_text(m) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        if "UpdateMemory" in self.tool_names:
+            if isinstance(messages[-1], ToolMessage):
+                return AIMessage(content="Done, I have updated my memory.")
+            update_types = next((types for turn, types in USER_TURNS
+                                 if turn.split("{")[0][:20] in last_user), ("todo",))
+            if not self.parallel_tool_calls:
+                update_types = update_types[:1]
+            return AIMessage(content="" if update_types else "Here is what I know.", tool_calls=[
+                {"name": "UpdateMemory", "args": {"update_type": t}, "id": f"call_{uuid.uuid4().hex}"}
+                for t in update_types])
+
+        tool_calls = []
+        existing = _INSTANCE_RE.findall(" ".join(_text(m) for m in messages))
+        if "PatchDoc" in self.tool_names and existing:
+            doc_id, schema_type = existing[0]
+            patch = ({"op": "replace", "path": "/status", "value": "in progress"} if schema_type == "ToDo"
+                     else {"op": "add", "path": "/interests/-", "value": "running"})
+            tool_calls.append({"name": "PatchDoc", "args": {"json_doc_id": doc_id, "planned_edits": "Update one field.",
+                                                           "patches": [patch]}})
+        if "ToDo" in self.tool_names:
+            tool_calls.append({"name": "ToDo", "args": {"task": last_user[:60], "time_to_complete": 30,
+                                                       "solutions": ["Do it this week", "Ask for help"]}})
+        elif "Profile" in self.tool_names and not existing:
+            tool_calls.append({"name": "Profile", "args": {"name": "Load test user", "location": "Lisbon",
+                                                          "job": "nurse", "connections": [], "interests": []}})
+        if not self.tool_names:
+            return AIMessage(content="Add a deadline and two solutions to every ToDo.")
+        return AIMessage(content="", tool_calls=[dict(call, id=f"call_{uuid.uuid4().hex}") for call in tool_calls])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+class LatencyStats:
+    """Thread-safe latency samples, grouped by label."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+
+    def record(self, label: str, seconds: float) -> None:
+        with self._lock:
+            self.samples.setdefault(label, []).append(seconds)
+
+    def rows(self) -> list[tuple[str, int, float, float, float]]:
+        """(label, count, p50, p95, p99) per label, with latencies in milliseconds."""
+        with self._lock:
+            samples = {label: list(values) for label, values in self.samples.items()}
+        rows = []
+        for label, values in sorted(samples.items()):
+            p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+            rows.append((label, len(values), p50, p95, p99))
+        return rows
+
+class NodeTimer(BaseCallbackHandler):
+    """Record the duration of every run of the given graph nodes."""
+    run_inline = True
+
+    def __init__(self, stats: LatencyStats, nodes: Iterable[str]):
+        self.stats = stats
+        self.nodes = set(nodes)
+        self._started: dict[UUID, tuple[str, float]] = {}
+
+    def on_chain_start(self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                       metadata: Optional[dict] = None, **kwargs: Any) -> None:
+        name = kwargs.get("name")
+        # A node runs as a sequence wrapping a callable of the same name; time the outer run only
+        if parent_run_id in self._started:
+            return
+        if name in self.nodes and (metadata or {}).get("langgraph_node") == name:
+            self._started[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.stats.record(started[0], time.perf_counter() - started[1])
+
+    def on_chain_error(self, error, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.stats.record(f"{started[0]} (error)", time.perf_counter() - started[1])
+
+_OP_NAMES = {GetOp: "get", SearchOp: "search", PutOp: "put", ListNamespacesOp: "list_namespaces"}
+
+def _batch_label(ops: list[Op]) -> str:
+    return "+".join(sorted({_OP_NAMES.get(type(op), type(op).__name__) for op in ops})) or "empty"
+
+class TimedStore(BaseStore):
+    """Record the duration of every batch sent to the wrapped store, labelled by its op types."""
+
+    def __init__(self, store: BaseStore, stats: LatencyStats):
+        self.store = store
+        self.stats = stats
+        self.supports_ttl = store.supports_ttl
+        self.ttl_config = store.ttl_config
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        start = time.perf_counter()
+        try:
+            return self.store.batch(ops)
+        finally:
+            self.stats.record(_batch_label(ops), time.perf_counter() - start)
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        start = time.perf_counter()
+        try:
+            return await self.store.abatch(ops)
+        finally:
+            self.stats.record(_batch_label(ops), time.perf_counter() - start)
+
+def _turn_config(user: int, thread: int, nodes: NodeTimer, options: dict) -> dict:
+    return {"configurable": {"user_id": f"load-user-{user}", "thread_id": f"load-user-{user}-thread-{thread}", **options},
+            "callbacks": [nodes]}
+
+def _turn_input(user: int, turn: int) -> dict:
+    text, _ = USER_TURNS[turn % len(USER_TURNS)]
+    return {"messages": [HumanMessage(content=text.format(user=f"user {user}"))]}
+
+def run_load_test(users: int, threads_per_user: int, turns: int, concurrency: int,
+                  model_latency: float, use_async: bool, options: dict) -> dict:
+    """Run the simulated conversations and return the latency stats and throughput."""
+    task_maistro.use_chat_model(ScriptedChatModel(latency=model_latency))
+    node_stats, store_stats, turn_stats = LatencyStats(), LatencyStats(), LatencyStats()
+    store = TimedStore(postgres_store.get_store() or InMemoryStore(), store_stats)
+    graph = task_maistro.builder.compile(store=store, checkpointer=MemorySaver())
+    nodes = NodeTimer(node_stats, task_maistro.builder.nodes)
+    conversations = [(user, thread) for user in range(users) for thread in range(threads_per_user)]
+
+    def converse(user: int, thread: int) -> None:
+        for turn in range(turns):
+            start = time.perf_counter()
+            graph.invoke(_turn_input(user, turn), _turn_config(user, thread, nodes, options))
+            turn_stats.record("turn", time.perf_counter() - start)
+
+    async def aconverse(user: int, thread: int, limit: asyncio.Semaphore) -> None:
+        async with limit:
+            for turn in range(turns):
+                start = time.perf_counter()
+                await graph.ainvoke(_turn_input(user, turn), _turn_config(user, thread, nodes, options))
+                turn_stats.record("turn", time.perf_counter() - start)
+
+    async def arun() -> None:
+        limit = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(aconverse(user, thread, limit) for user, thread in conversations))
+
+    start = time.perf_counter()
+    if use_async:
+        asyncio.run(arun())
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(converse, user, thread) for user, thread in conversations]:
+                future.result()
+    # Queued memory updates are part of the work the graph generated
+    task_maistro.write_behind.flush()
+    elapsed = time.perf_counter() - start
+
+    return {"elapsed": elapsed, "turns": len(conversations) * turns,
+            "turn": turn_stats, "nodes": node_stats, "store": store_stats}
+
+def print_report(report: dict) -> None:
+    """Print throughput and p50/p95/p99 latency per turn, node and store operation."""
+    print(f"{report['turns']} turns in {report['elapsed']:.2f}s: {report['turns'] / report['elapsed']:.1f} turns/s")
+    for title in ("turn", "nodes", "store"):
+        print(f"\n{title:<28}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for label, count, p50, p95, p99 in report[title].rows():
+            print(f"{label:<28}{count:>8}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test of the task_maistro graph")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--threads-per-user", type=int, default=1)
+    parser.add_argument("--turns", type=int, default=len(USER_TURNS), help="turns per thread")
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations running at once")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="seconds per fake model call")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use graph.ainvoke")
+    parser.add_argument("--parallel-memory-updates", action="store_true")
+    parser.add_argument("--background-memory-updates", action="store_true")
+    parser.add_argument("--todo-relevance-top-k", type=int, default=0)
+    args = parser.parse_args()
+
+    # Stores come from the environment as for the server: MEMORY_STORE_URI and
+    # MEMORY_CACHE_REDIS_URI, with an in-memory store otherwise
+    print_report(run_load_test(
+        args.users, args.threads_per_user, args.turns, args.concurrency, args.model_latency, args.use_async,
+        {"parallel_memory_updates": args.parallel_memory_updates,
+         "background_memory_updates": args.background_memory_updates,
+         "todo_relevance_top_k": args.todo_relevance_top_k}))
@@ -0,0 +1,112 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+from weakref import WeakKeyDictionary
+
+from langgraph.store.base import BaseStore, Item, SearchOp
+
+## Memory snapshots
+
+# The three memory types task_mAIstro keeps per user, in namespace order
+MEMORY_TYPES = ("profile", "todo", "instructions")
+
+def memory_namespace(memory_type: str, todo_category: str, user_id: str) -> tuple[str, ...]:
+    """Namespace used in the store for one memory type of one user."""
+    return (memory_type, todo_category, user_id)
+
+@dataclass(frozen=True)
+class MemorySnapshot:
+    """All long-term memories of one user, as read in a single store round trip."""
+    version: int
+    loaded_at: float
+    profile: list[Item]
+    todo: list[Item]
+    instructions: list[Item]
+
+    def items(self, memory_type: str) -> list[Item]:
+        """Return the stored items for one of the MEMORY_TYPES."""
+        return getattr(self, memory_type)
+
+class MemorySnapshotCache:
+    """Versioned, in-process cache of per-user memory snapshots.
+
+    A snapshot is loaded with one `store.batch` call covering every memory type.
+    Writers call `invalidate` after `store.put`, which bumps the user's version;
+    a load that raced with a write is returned to the caller but never cached.
+    `ttl` bounds how long a snapshot may be served without a re-read, which
+    covers writes made by other processes sharing the same store. `limit` caps
+    the items read per memory type; the store's own default page is only 10.
+    """
+
+    def __init__(self, ttl: float = 30.0, limit: int = 500):
+        self.ttl = ttl
+        self.limit = limit
+        self._lock = threading.Lock()
+        # store -> {(todo_category, user_id): version}
+        self._versions: WeakKeyDictionary = WeakKeyDictionary()
+        # store -> {(todo_category, user_id): MemorySnapshot}
+        self._snapshots: WeakKeyDictionary = WeakKeyDictionary()
+
+    def _version(self, store: BaseStore, key: tuple[str, str]) -> int:
+        return self._versions.setdefault(store, {}).get(key, 0)
+
+    def _cached(self, store: BaseStore, key: tuple[str, str]) -> Optional[MemorySnapshot]:
+        with self._lock:
+            snapshot = self._snapshots.get(store, {}).get(key)
+            if snapshot is None:
+                return None
+            if snapshot.version != self._version(store, key):
+                return None
+            if time.monotonic() - snapshot.loaded_at > self.ttl:
+                return None
+            return snapshot
+
+    def _begin_load(self, store: BaseStore, todo_category: str, user_id: str,
+                    refresh: bool) -> tuple[Optional[MemorySnapshot], int, list[SearchOp]]:
+        key = (todo_category, user_id)
+        snapshot = None if refresh else self._cached(store, key)
+        with self._lock:
+            version = self._version(store, key)
+        ops = [SearchOp(memory_namespace(memory_type, todo_category, user_id), limit=self.limit)
+               for memory_type in MEMORY_TYPES]
+        return snapshot, version, ops
+
+    def _finish_load(self, store: BaseStore, todo_category: str, user_id: str,
+                     version: int, results: list) -> MemorySnapshot:
+        key = (todo_category, user_id)
+        snapshot = MemorySnapshot(version, time.monotonic(), *results)
+        with self._lock:
+            # Only cache the snapshot if no write happened while it was loading
+            if self._version(store, key) == version:
+                self._snapshots.setdefault(store, {})[key] = snapshot
+        return snapshot
+
+    def load(self, store: BaseStore, todo_category: str, user_id: str, refresh: bool = False) -> MemorySnapshot:
+        """Return the user's memory snapshot, reading the store only on a cache miss.
+
+        With `refresh`, always read the store and cache the result. Code that
+        modifies memories reads this way, since a cached snapshot may be up to
+        `ttl` seconds behind writes from other processes.
+        """
+        snapshot, version, ops = self._begin_load(store, todo_category, user_id, refresh)
+        if snapshot is not None:
+            return snapshot
+
+        # Fetch every memory type in a single batched store operation
+        return self._finish_load(store, todo_category, user_id, version, store.batch(ops))
+
+    async def aload(self, store: BaseStore, todo_category: str, user_id: str, refresh: bool = False) -> MemorySnapshot:
+        """Async version of `load`, using `store.abatch`."""
+        snapshot, version, ops = self._begin_load(store, todo_category, user_id, refresh)
+        if snapshot is not None:
+            return snapshot
+        return self._finish_load(store, todo_category, user_id, version, await store.abatch(ops))
+
+    def invalidate(self, store: BaseStore, todo_category: str, user_id: str) -> None:
+        """Drop the user's cached snapshot; call after every write to their memories."""
+        key = (todo_category, user_id)
+        with self._lock:
+            versions = self._versions.setdefault(store, {})
+            versions[key] = versions.get(key, 0) + 1
+            self._snapshots.get(store, {}).pop(key, None)
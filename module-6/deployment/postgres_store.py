@@ -0,0 +1,100 @@
+import atexit
+import os
+import threading
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
+
+from langgraph.store.postgres import PostgresStore
+
+## Pooled Postgres store for task_maistro
+
+# Extra indexes on top of PostgresStore's own migrations. task_mAIstro reads whole
+# namespaces (prefix match) and PostgresStore returns search results newest first,
+# so (prefix, updated_at) serves those reads straight from the index.
+EXTRA_INDEXES = [
+    """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS store_prefix_updated_at_idx
+    ON store USING btree (prefix text_pattern_ops, updated_at DESC);
+    """,
+]
+
+@dataclass(kw_only=True)
+class PostgresStoreSettings:
+    """Connection and pool settings, read from MEMORY_STORE_* environment variables."""
+    uri: Optional[str] = None # MEMORY_STORE_URI, a postgres:// connection string
+    pool_min_size: int = 2 # Connections kept open even when idle
+    pool_max_size: int = 20 # Upper bound on concurrent store operations per process
+    pool_timeout: float = 10.0 # Seconds to wait for a free connection before failing
+    pool_max_idle: float = 300.0 # Seconds before an idle connection above min size is closed
+    prepare_threshold: int = 0 # Executions before psycopg prepares a statement (0 = prepare on first use; None disables, e.g. behind PgBouncer)
+
+    @classmethod
+    def from_env(cls) -> "PostgresStoreSettings":
+        """Build settings from the environment, keeping defaults for unset variables."""
+        values = {}
+        for f in fields(cls):
+            raw = os.environ.get(f"MEMORY_STORE_{f.name.upper()}")
+            if raw is None:
+                continue
+            if f.name == "prepare_threshold" and raw.lower() == "none":
+                values[f.name] = None
+            elif f.name == "uri":
+                values[f.name] = raw
+            else:
+                values[f.name] = type(f.default)(raw)
+        return cls(**values)
+
+def create_postgres_store(settings: PostgresStoreSettings) -> PostgresStore:
+    """Open a connection pool, run the store migrations and return a PostgresStore on it.
+
+    Statements are prepared by psycopg on each pooled connection, so the repeated
+    namespace/key lookups of task_mAIstro are parsed and planned once per connection.
+    `store.batch` already writes all PutOps of a batch in one statement; the graph
+    batches its puts accordingly.
+    """
+    if not settings.uri:
+        raise ValueError("MEMORY_STORE_URI is not set")
+    pool = ConnectionPool(
+        settings.uri,
+        min_size=settings.pool_min_size,
+        max_size=settings.pool_max_size,
+        timeout=settings.pool_timeout,
+        max_idle=settings.pool_max_idle,
+        kwargs={
+            "autocommit": True,
+            "prepare_threshold": settings.prepare_threshold,
+            "row_factory": dict_row,
+        },
+        open=True,
+    )
+    pool.wait()
+    store = PostgresStore(pool)
+    store.setup()
+    with pool.connection() as conn:
+        for sql in EXTRA_INDEXES:
+            conn.execute(sql)
+    atexit.register(pool.close)
+    return store
+
+_store: Optional[PostgresStore] = None
+_lock = threading.Lock()
+
+def get_store() -> Optional[PostgresStore]:
+    """Process-wide pooled store if MEMORY_STORE_URI is set, else None (use the injected store)."""
+    global _store
+    settings = PostgresStoreSettings.from_env()
+    if not settings.uri:
+        return None
+    with _lock:
+        if _store is None:
+            _store = create_postgres_store(settings)
+        return _store
+
+if __name__ == "__main__":
+    # Run the migrations and create the extra indexes ahead of deployment
+    if get_store() is None:
+        raise SystemExit("Set MEMORY_STORE_URI to the Postgres database to set up")
+    print("Memory store is set up")
@@ -0,0 +1,84 @@
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+## Prompt cache instrumentation
+
+@dataclass(frozen=True)
+class PromptCacheRecord:
+    """Input token usage of one chat model call."""
+    label: str
+    input_tokens: int
+    cached_tokens: int
+    timestamp: float
+
+    @property
+    def uncached_tokens(self) -> int:
+        return self.input_tokens - self.cached_tokens
+
+@dataclass
+class PromptCacheTotals:
+    """Input token usage summed over all calls with the same label."""
+    calls: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of input tokens served from the provider's prompt cache."""
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+class _PromptCacheHandler(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self, stats: "PromptCacheStats", label: str):
+        self.stats = stats
+        self.label = label
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None:
+                    self.stats.record(self.label, message)
+
+class PromptCacheStats:
+    """Cached versus uncached input tokens per chat model call, read from usage metadata.
+
+    Attach `handler(label)` to a call through its config, or call `record` with the
+    response message. Totals are kept per label; the most recent calls are kept in
+    `recent` for inspection.
+    """
+
+    def __init__(self, history: int = 1000):
+        self._lock = threading.Lock()
+        self.recent: deque[PromptCacheRecord] = deque(maxlen=history)
+        self.totals: dict[str, PromptCacheTotals] = {}
+
+    def handler(self, label: str) -> BaseCallbackHandler:
+        """Callback handler that records every chat model call it sees under `label`."""
+        return _PromptCacheHandler(self, label)
+
+    def record(self, label: str, message: Any) -> None:
+        """Record the input token usage of one response message, if it reports any."""
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return
+        input_tokens = usage.get("input_tokens", 0)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        record = PromptCacheRecord(label, input_tokens, cached_tokens, time.time())
+        with self._lock:
+            self.recent.append(record)
+            totals = self.totals.setdefault(label, PromptCacheTotals())
+            totals.calls += 1
+            totals.input_tokens += input_tokens
+            totals.cached_tokens += cached_tokens
+        logger.debug("%s: %d input tokens, %d from prompt cache", label, input_tokens, cached_tokens)
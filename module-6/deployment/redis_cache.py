@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Any, Iterable, Optional
+from weakref import WeakKeyDictionary
+
+from langgraph.store.base import BaseStore, GetOp, Item, Op, PutOp, Result, SearchItem, SearchOp
+
+from memory_cache import MEMORY_TYPES
+
+logger = logging.getLogger(__name__)
+
+## Redis read-through cache for the memory store
+
+# Top-level namespaces served from the cache: the memories, the ToDo query index and
+# the ToDo archive
+CACHED_NAMESPACES = MEMORY_TYPES + ("todo_index", "todo_archive")
+
+class LocalRedis:
+    """In-process stand-in for the few Redis commands RedisCachedStore uses.
+
+    Keys with an expiry are dropped when read after it, like Redis does lazily.
+    Use it through MEMORY_CACHE_REDIS_URI=local:// to run without a Redis server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: dict[str, tuple[Any, Optional[float]]] = {}
+
+    def _get(self, name: str) -> Any:
+        entry = self._data.get(name)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._data[name]
+            return None
+        return value
+
+    def get(self, name: str) -> Any:
+        with self._lock:
+            return self._get(name)
+
+    def mget(self, names: list[str]) -> list[Any]:
+        with self._lock:
+            return [self._get(name) for name in names]
+
+    def set(self, name: str, value: Any, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            if nx and self._get(name) is not None:
+                return None
+            self._data[name] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, *names: str) -> int:
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+def _decode(value: Any) -> Optional[str]:
+    return value.decode() if isinstance(value, bytes) else value
+
+def _dump_item(item: Optional[Item]) -> Optional[dict]:
+    if item is None:
+        return None
+    data = item.dict()
+    data["namespace"] = list(item.namespace)
+    return data
+
+def _load_item(data: Optional[dict], search: bool) -> Optional[Item]:
+    if data is None:
+        return None
+    kwargs = dict(namespace=tuple(data["namespace"]), key=data["key"], value=data["value"],
+                  created_at=datetime.fromisoformat(data["created_at"]),
+                  updated_at=datetime.fromisoformat(data["updated_at"]))
+    if search:
+        return SearchItem(score=data.get("score"), **kwargs)
+    return Item(**kwargs)
+
+class RedisCachedStore(BaseStore):
+    """Read-through Redis cache in front of another BaseStore.
+
+    GetOp and SearchOp results for CACHED_NAMESPACES are stored in Redis for `ttl`
+    seconds. Every namespace prefix has a generation token in Redis, and cache
+    keys include the token of the namespace they read. Puts are written through
+    to the store and then replace the tokens of the written namespace and all of
+    its prefixes, so every cached read that could see the write is orphaned at
+    once, in every process sharing the Redis, and expires by TTL. A read that
+    raced with a write is cached under the old token and never served.
+
+    Batches containing a PutOp go to the store as a whole, so reads in the same
+    batch see the writes. If Redis is unavailable, reads fall back to the store.
+    """
+
+    def __init__(self, store: BaseStore, client: Any, ttl: int = 300,
+                 namespaces: Iterable[str] = CACHED_NAMESPACES, key_prefix: str = "task_maistro:memory"):
+        self.store = store
+        self.client = client
+        self.ttl = ttl
+        self.namespaces = frozenset(namespaces)
+        self.key_prefix = key_prefix
+        self.supports_ttl = store.supports_ttl
+        self.ttl_config = store.ttl_config
+
+    def _generation_key(self, namespace: tuple[str, ...]) -> str:
+        return f"{self.key_prefix}:gen:{json.dumps(list(namespace))}"
+
+    def _read_namespace(self, op: Op) -> Optional[tuple[str, ...]]:
+        # Namespace whose generation guards a cached read, or None if the op is not cached
+        if isinstance(op, GetOp):
+            namespace = op.namespace
+        elif isinstance(op, SearchOp):
+            namespace = op.namespace_prefix
+        else:
+            return None
+        return namespace if namespace and namespace[0] in self.namespaces else None
+
+    def _entry_key(self, op: Op, generation: str) -> str:
+        if isinstance(op, GetOp):
+            params = ["get", list(op.namespace), op.key]
+        else:
+            params = ["search", list(op.namespace_prefix), op.filter, op.limit, op.offset, op.query]
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+        return f"{self.key_prefix}:{generation}:{digest}"
+
+    def _generations(self, namespaces: list[tuple[str, ...]]) -> dict[tuple[str, ...], str]:
+        keys = [self._generation_key(namespace) for namespace in namespaces]
+        tokens = [_decode(token) for token in self.client.mget(keys)]
+        missing = [i for i, token in enumerate(tokens) if token is None]
+        if missing:
+            # Start a generation for namespaces never written (or whose token was evicted);
+            # a fresh random token can never match entries cached under an older one
+            for i in missing:
+                self.client.set(keys[i], uuid.uuid4().hex, nx=True)
+            for i, token in zip(missing, self.client.mget([keys[i] for i in missing])):
+                tokens[i] = _decode(token)
+        return dict(zip(namespaces, tokens))
+
+    def _lookup(self, ops: list[Op]) -> tuple[list[Result], dict[int, str]]:
+        """Serve what Redis has; return the results and the entry keys of the misses."""
+        results: list[Result] = [None] * len(ops)
+        misses: dict[int, Optional[str]] = {}
+        cached = {}
+        if not any(isinstance(op, PutOp) for op in ops):
+            for i, op in enumerate(ops):
+                namespace = self._read_namespace(op)
+                if namespace is not None:
+                    cached[i] = namespace
+        try:
+            if cached:
+                generations = self._generations(list(dict.fromkeys(cached.values())))
+                entry_keys = {i: self._entry_key(ops[i], generations[namespace])
+                              for i, namespace in cached.items()}
+                values = self.client.mget(list(entry_keys.values()))
+                for (i, entry_key), value in zip(entry_keys.items(), values):
+                    if value is None:
+                        misses[i] = entry_key
+                    else:
+                        data = json.loads(_decode(value))
+                        if isinstance(ops[i], GetOp):
+                            results[i] = _load_item(data, search=False)
+                        else:
+                            results[i] = [_load_item(item, search=True) for item in data]
+        except Exception:
+            logger.exception("Memory cache lookup failed, reading from the store")
+            misses = {i: None for i in cached}
+        for i in range(len(ops)):
+            if i not in cached:
+                misses[i] = None
+        return results, dict(sorted(misses.items()))
+
+    def _fill(self, ops: list[Op], results: list[Result], misses: dict[int, Optional[str]],
+              store_results: list[Result]) -> None:
+        """Put the store's results in place and cache the cacheable ones."""
+        for (i, entry_key), result in zip(misses.items(), store_results):
+            results[i] = result
+            if entry_key is None:
+                continue
+            if isinstance(ops[i], GetOp):
+                data = _dump_item(result)
+            else:
+                data = [_dump_item(item) for item in result]
+            try:
+                self.client.set(entry_key, json.dumps(data, default=str), ex=self.ttl)
+            except Exception:
+                logger.exception("Memory cache fill failed")
+
+    def _invalidate(self, ops: list[Op]) -> None:
+        """Start a new generation for every namespace prefix a PutOp wrote to."""
+        namespaces = {put.namespace[:n] for put in ops if isinstance(put, PutOp)
+                      if put.namespace and put.namespace[0] in self.namespaces
+                      for n in range(1, len(put.namespace) + 1)}
+        try:
+            for namespace in namespaces:
+                self.client.set(self._generation_key(namespace), uuid.uuid4().hex)
+        except Exception:
+            # Cached reads of these namespaces may be served stale until they expire
+            logger.exception("Memory cache invalidation failed")
+
+    def batch(self, ops: Iterable[Op]) -> list[Result]:
+        ops = list(ops)
+        results, misses = self._lookup(ops)
+        if misses:
+            self._fill(ops, results, misses, self.store.batch([ops[i] for i in misses]))
+        self._invalidate(ops)
+        return results
+
+    async def abatch(self, ops: Iterable[Op]) -> list[Result]:
+        # The Redis client is synchronous; keep its round trips off the event loop
+        ops = list(ops)
+        results, misses = await asyncio.to_thread(self._lookup, ops)
+        if misses:
+            store_results = await self.store.abatch([ops[i] for i in misses])
+            await asyncio.to_thread(self._fill, ops, results, misses, store_results)
+        if any(isinstance(op, PutOp) for op in ops):
+            await asyncio.to_thread(self._invalidate, ops)
+        return results
+
+@dataclass(kw_only=True)
+class RedisCacheSettings:
+    """Cache settings, read from MEMORY_CACHE_* environment variables."""
+    redis_uri: Optional[str] = None # MEMORY_CACHE_REDIS_URI, a redis:// URL, or local:// for LocalRedis
+    ttl: int = 300 # Seconds a cached read is served before it is read from the store again
+
+    @classmethod
+    def from_env(cls) -> "RedisCacheSettings":
+        """Build settings from the environment, keeping defaults for unset variables."""
+        values = {}
+        for f in fields(cls):
+            raw = os.environ.get(f"MEMORY_CACHE_{f.name.upper()}")
+            if raw is not None:
+                values[f.name] = raw if f.name == "redis_uri" else type(f.default)(raw)
+        return cls(**values)
+
+def create_client(redis_uri: str) -> Any:
+    """Redis client for the URI; local:// gives a LocalRedis shared by the process."""
+    if redis_uri.startswith("local://"):
+        return _local_redis
+    import redis
+    return redis.Redis.from_url(redis_uri)
+
+_local_redis = LocalRedis()
+_clients: dict[str, Any] = {}
+_wrapped: WeakKeyDictionary = WeakKeyDictionary()
+_lock = threading.Lock()
+
+def cached_store(store: BaseStore) -> BaseStore:
+    """Wrap the store in a RedisCachedStore if MEMORY_CACHE_REDIS_URI is set, else return it as is.
+
+    The same wrapper is returned for the same store, so per-store caches keyed by
+    the wrapper keep working across calls.
+    """
+    settings = RedisCacheSettings.from_env()
+    if not settings.redis_uri or store is None or isinstance(store, RedisCachedStore):
+        return store
+    with _lock:
+        wrapper = _wrapped.get(store)
+        if wrapper is None:
+            client = _clients.get(settings.redis_uri)
+            if client is None:
+                client = _clients[settings.redis_uri] = create_client(settings.redis_uri)
+            wrapper = _wrapped[store] = RedisCachedStore(store, client, ttl=settings.ttl)
+        return wrapper
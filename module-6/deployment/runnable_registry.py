@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Callable, Hashable, Sequence
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ensure_config, merge_configs
+
+from trustcall import create_extractor
+
+## Registry of prebuilt runnables
+
+def _options_key(options: dict[str, Any]) -> tuple:
+    return tuple(sorted(options.items()))
+
+class RunnableRegistry:
+    """Build tool-bound models, structured-output models and Trustcall extractors once.
+
+    Converting schemas to tools and compiling a Trustcall extractor graph is pure
+    overhead when done inside a node on every call. Runnables are keyed by the
+    model instance, the schemas and the options, built on first use and reused by
+    every later call. Per-call listeners should be passed through the config
+    (`config=with_callbacks(capture)`) instead of rebuilding the runnable.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._runnables: dict[Hashable, tuple[BaseChatModel, Runnable]] = {}
+
+    def get(self, kind: str, model: BaseChatModel, schemas: Sequence[Any],
+            options: dict[str, Any], build: Callable[[], Runnable]) -> Runnable:
+        """Return the cached runnable for this key, building it on first use."""
+        # The model is kept alive by the entry, so its id stays unique
+        key = (kind, id(model), tuple(schemas), _options_key(options))
+        with self._lock:
+            entry = self._runnables.get(key)
+            if entry is None:
+                entry = self._runnables[key] = (model, build())
+            return entry[1]
+
+    def bind_tools(self, model: BaseChatModel, tools: Sequence[Any], **kwargs) -> Runnable:
+        """Cached `model.bind_tools(tools, **kwargs)`."""
+        return self.get("bind_tools", model, tools, kwargs,
+                        lambda: model.bind_tools(list(tools), **kwargs))
+
+    def structured_output(self, model: BaseChatModel, schema: Any, **kwargs) -> Runnable:
+        """Cached `model.with_structured_output(schema, **kwargs)`."""
+        return self.get("structured_output", model, [schema], kwargs,
+                        lambda: model.with_structured_output(schema, **kwargs))
+
+    def extractor(self, model: BaseChatModel, tools: Sequence[Any], **kwargs) -> Runnable:
+        """Cached `trustcall.create_extractor(model, tools=tools, **kwargs)`."""
+        return self.get("extractor", model, tools, kwargs,
+                        lambda: create_extractor(model, tools=list(tools), **kwargs))
+
+def with_callbacks(*handlers: BaseCallbackHandler) -> RunnableConfig:
+    """Config for one call that adds `handlers` to the callbacks of the running node.
+
+    A plain `config={"callbacks": [...]}` replaces the inherited callbacks, which cuts
+    the call out of the run's trace and out of `stream_mode="messages"`.
+    """
+    return merge_configs(ensure_config(), {"callbacks": list(handlers)})
+
+# Shared by every node in this process
+registry = RunnableRegistry()
@@ -1,100 +1,123 @@
+import operator
 import uuid
-from datetime import datetime
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import partial
 
 from pydantic import BaseModel, Field
 
-from trustcall import create_extractor
-
-from typing import Literal, Optional, TypedDict
+from typing import Annotated, Any, Literal, Optional, TypedDict
 
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
 from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import merge_message_runs
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, BaseMessage, ToolMessage
 
 from langchain_openai import ChatOpenAI
 
 from langgraph.checkpoint.memory import MemorySaver
+from langgraph.constants import Send
 from langgraph.graph import StateGraph, MessagesState, START, END
-from langgraph.store.base import BaseStore
+from langgraph.store.base import BaseStore, Item, PutOp
 from langgraph.store.memory import InMemoryStore
+from langgraph.utils.runnable import RunnableCallable
 
 import configuration
+import postgres_store
+from redis_cache import cached_store
+from memory_cache import MemorySnapshot, MemorySnapshotCache, memory_namespace
+from prompt_cache import PromptCacheStats
+from runnable_registry import registry, with_callbacks
+from todo_index import TodoIndexes
+from todo_render import render_todos
+from todo_tiering import TieringPolicy, TodoTiers
+from write_behind import WriteBehindQueue
 
 ## Utilities 
 
-# Inspect the tool calls for Trustcall
-class Spy:
-    def __init__(self):
-        self.called_tools = []
-
-    def __call__(self, run):
-        q = [run]
-        while q:
-            r = q.pop()
-            if r.child_runs:
-                q.extend(r.child_runs)
-            if r.run_type == "chat_model":
-                self.called_tools.append(
-                    r.outputs["generations"][0][0]["message"]["kwargs"]["tool_calls"]
-                )
-
-# Extract information from tool calls for both patches and new memories in Trustcall
-def extract_tool_info(tool_calls, schema_name="Memory"):
-    """Extract information from tool calls for both patches and new memories.
+# Capture the changes Trustcall makes, as the chat model returns its tool calls
+@dataclass
+class MemoryChange:
+    """One change proposed by Trustcall for a memory document."""
+    type: Literal["update", "no_update", "new"]
+    value: Any = None
+    doc_id: Optional[str] = None
+    planned_edits: Optional[str] = None
+
+class ChangeCapture(BaseCallbackHandler):
+    """Record Trustcall's PatchDoc and insert tool calls as structured changes.
+
+    Attach per call through the config (`config=with_callbacks(capture)`). Each
+    chat model call is inspected when it finishes, straight from the generated
+    message, so no run tree is retained or walked afterwards.
+    """
+
+    run_inline = True
+
+    def __init__(self, schema_name="Memory"):
+        self.schema_name = schema_name
+        self.changes: list[MemoryChange] = []
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                for call in getattr(message, "tool_calls", None) or []:
+                    if call['name'] == 'PatchDoc':
+                        args = call['args']
+                        # Check if there are any patches
+                        if args.get('patches'):
+                            self.changes.append(MemoryChange('update', args['patches'][0]['value'],
+                                                             args['json_doc_id'], args['planned_edits']))
+                        else:
+                            # Handle case where no changes were needed
+                            self.changes.append(MemoryChange('no_update', None,
+                                                             args['json_doc_id'], args['planned_edits']))
+                    elif call['name'] == self.schema_name:
+                        self.changes.append(MemoryChange('new', call['args']))
+
+# Format the captured changes for the tool message returned to the chatbot
+def format_changes(changes, schema_name="Memory"):
+    """Describe patches and new memories made by Trustcall as a single string.
     
     Args:
-        tool_calls: List of tool calls from the model
+        changes: MemoryChange records collected by ChangeCapture
         schema_name: Name of the schema tool (e.g., "Memory", "ToDo", "Profile")
     """
-    # Initialize list of changes
-    changes = []
-    
-    for call_group in tool_calls:
-        for call in call_group:
-            if call['name'] == 'PatchDoc':
-                # Check if there are any patches
-                if call['args']['patches']:
-                    changes.append({
-                        'type': 'update',
-                        'doc_id': call['args']['json_doc_id'],
-                        'planned_edits': call['args']['planned_edits'],
-                        'value': call['args']['patches'][0]['value']
-                    })
-                else:
-                    # Handle case where no changes were needed
-                    changes.append({
-                        'type': 'no_update',
-                        'doc_id': call['args']['json_doc_id'],
-                        'planned_edits': call['args']['planned_edits']
-                    })
-            elif call['name'] == schema_name:
-                changes.append({
-                    'type': 'new',
-                    'value': call['args']
-                })
-
-    # Format results as a single string
     result_parts = []
     for change in changes:
-        if change['type'] == 'update':
+        if change.type == 'update':
             result_parts.append(
-                f"Document {change['doc_id']} updated:\n"
-                f"Plan: {change['planned_edits']}\n"
-                f"Added content: {change['value']}"
+                f"Document {change.doc_id} updated:\n"
+                f"Plan: {change.planned_edits}\n"
+                f"Added content: {change.value}"
             )
-        elif change['type'] == 'no_update':
+        elif change.type == 'no_update':
             result_parts.append(
-                f"Document {change['doc_id']} unchanged:\n"
-                f"{change['planned_edits']}"
+                f"Document {change.doc_id} unchanged:\n"
+                f"{change.planned_edits}"
             )
         else:
             result_parts.append(
                 f"New {schema_name} created:\n"
-                f"Content: {change['value']}"
+                f"Content: {change.value}"
             )
     
     return "\n\n".join(result_parts)
 
+# Answer every UpdateMemory call of the given type in the last AI message
+def tool_messages(message, update_type, content):
+    """Build one tool message per UpdateMemory call that requested `update_type`.
+
+    With parallel memory updates the model may request several updates in a single
+    message, and every tool call needs its own response before the next model call.
+    """
+    return [{"role": "tool", "content": content, "tool_call_id": tool_call['id']}
+            for tool_call in message.tool_calls
+            if tool_call['args']['update_type'] == update_type]
+
 ## Schema definitions
 
 # User profile schema
@@ -137,19 +160,66 @@ class UpdateMemory(TypedDict):
     """ Decision on what memory type to update """
     update_type: Literal['user', 'todo', 'instructions']
 
+# Graph state
+class State(MessagesState):
+    # Id of the last message each memory type was extracted from, keyed by update type.
+    # Merged with `|` because parallel memory updates write to it in the same step.
+    extraction_watermarks: Annotated[dict[str, str], operator.or_]
+
+# Node that handles each memory update type
+UPDATE_NODES = {
+    "user": "update_profile",
+    "todo": "update_todos",
+    "instructions": "update_instructions",
+}
+
 # Initialize the model
 model = ChatOpenAI(model="gpt-4o", temperature=0)
 
+# Per-user memory snapshots, shared by all nodes of this process
+memory_cache = MemorySnapshotCache()
+
+# Local relevance indexes over each user's ToDos (todo_relevance_top_k)
+todo_indexes = TodoIndexes()
+
+# Cached versus uncached input tokens of every model call made by the graph
+prompt_cache_stats = PromptCacheStats()
+
+# Worker pool for memory updates that run after the reply (background_memory_updates)
+write_behind = WriteBehindQueue()
+
 ## Create the Trustcall extractors for updating the user profile and ToDo list
-profile_extractor = create_extractor(
-    model,
-    tools=[Profile],
-    tool_choice="Profile",
-)
+def build_extractors(chat_model: BaseChatModel):
+
+    """Trustcall extractors for the user profile and the ToDo list on top of `chat_model`."""
+    profile_extractor = registry.extractor(
+        chat_model,
+        tools=[Profile],
+        tool_choice="Profile",
+    )
+
+    todo_extractor = registry.extractor(
+        chat_model,
+        tools=[ToDo],
+        tool_choice="ToDo",
+        enable_inserts=True,
+    )
+    return profile_extractor, todo_extractor
+
+profile_extractor, todo_extractor = build_extractors(model)
+
+def use_chat_model(chat_model: BaseChatModel) -> None:
+
+    """Swap the chat model used by every node, e.g. for the local fake in load_test.py."""
+    global model, profile_extractor, todo_extractor
+    model = chat_model
+    profile_extractor, todo_extractor = build_extractors(chat_model)
 
 ## Prompts 
 
-# Chatbot instruction for choosing what to update and what tools to call 
+# Chatbot instruction for choosing what to update and what tools to call.
+# This part of the prompt only depends on the configured role, so it stays byte-identical
+# across turns and users and can be served from the provider's prompt prefix cache.
 MODEL_SYSTEM_MESSAGE = """{task_maistro_role} 
 
 You have a long term memory which keeps track of three things:
@@ -157,20 +227,7 @@ You have a long term memory which keeps track of three things:
 2. The user's ToDo list
 3. General instructions for updating the ToDo list
 
-Here is the current User Profile (may be empty if no information has been collected yet):
-<user_profile>
-{user_profile}
-</user_profile>
-
-Here is the current ToDo List (may be empty if no tasks have been added yet):
-<todo>
-{todo}
-</todo>
-
-Here are the current user-specified preferences for updating the ToDo list (may be empty if no preferences have been specified yet):
-<instructions>
-{instructions}
-</instructions>
+The current contents of your long term memory are given in the next system message.
 
 Here are your instructions for reasoning about the user's messages:
 
@@ -190,6 +247,23 @@ Here are your instructions for reasoning about the user's messages:
 
 5. Respond naturally to user user after a tool call was made to save memories, or if no tool call was made."""
 
+# Current memories, sent after the static instructions so that memory changes
+# only invalidate the cached prompt from this point on
+MEMORY_SYSTEM_MESSAGE = """Here is the current User Profile (may be empty if no information has been collected yet):
+<user_profile>
+{user_profile}
+</user_profile>
+
+Here is the current ToDo List (may be empty if no tasks have been added yet):
+<todo>
+{todo}
+</todo>
+
+Here are the current user-specified preferences for updating the ToDo list (may be empty if no preferences have been specified yet):
+<instructions>
+{instructions}
+</instructions>"""
+
 # Trustcall instruction
 TRUSTCALL_INSTRUCTION = """Reflect on following interaction. 
 
@@ -211,62 +285,96 @@ Your current instructions are:
 </current_instructions>"""
 
 ## Node definitions
+# Every node has a sync and an async implementation. graph.invoke/stream use the
+# sync ones; graph.ainvoke/astream (and the LangGraph server) use the async ones,
+# so store and model calls do not tie up executor threads.
 
-def task_mAIstro(state: MessagesState, config: RunnableConfig, store: BaseStore):
+def latest_user_text(messages: list[BaseMessage]) -> str:
 
-    """Load memories from the store and use them to personalize the chatbot's response."""
-    
-    # Get the user ID from the config
-    configurable = configuration.Configuration.from_runnable_config(config)
-    user_id = configurable.user_id
-    todo_category = configurable.todo_category
-    task_maistro_role = configurable.task_maistro_role
+    """Text of the most recent user message, used to rank ToDos by relevance."""
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            if isinstance(message.content, str):
+                return message.content
+            return " ".join(part.get("text", "") if isinstance(part, dict) else str(part)
+                            for part in message.content)
+    return ""
 
-   # Retrieve profile memory from the store
-    namespace = ("profile", todo_category, user_id)
-    memories = store.search(namespace)
+def select_todos(store: BaseStore, configurable: configuration.Configuration, items, messages):
+
+    """Keep only the ToDos most relevant to the latest user message, if todo_relevance_top_k is set."""
+    return todo_indexes.relevant(store, configurable.todo_category, configurable.user_id,
+                                 items, latest_user_text(messages), configurable.todo_relevance_top_k)
+
+def build_system_messages(snapshot: MemorySnapshot, configurable: configuration.Configuration, todo_items) -> list[SystemMessage]:
+
+    """Build the chatbot system prompt: static instructions first, then the user's memories."""
+
+    # Retrieve profile memory
+    memories = snapshot.profile
     if memories:
         user_profile = memories[0].value
     else:
         user_profile = None
 
-    # Retrieve people memory from the store
-    namespace = ("todo", todo_category, user_id)
-    memories = store.search(namespace)
-    todo = "\n".join(f"{mem.value}" for mem in memories)
+    # Retrieve ToDo memory, rendered compactly within the configured token budget
+    todo = render_todos((mem.value for mem in todo_items), configurable.todo_token_budget)
+    if len(todo_items) < len(snapshot.todo):
+        todo += f"\n(showing the {len(todo_items)} items most relevant to the latest message, out of {len(snapshot.todo)})"
 
     # Retrieve custom instructions
-    namespace = ("instructions", todo_category, user_id)
-    memories = store.search(namespace)
+    memories = snapshot.instructions
     if memories:
         instructions = memories[0].value
     else:
         instructions = ""
     
-    system_msg = MODEL_SYSTEM_MESSAGE.format(task_maistro_role=task_maistro_role, user_profile=user_profile, todo=todo, instructions=instructions)
+    return [SystemMessage(content=MODEL_SYSTEM_MESSAGE.format(task_maistro_role=configurable.task_maistro_role)),
+            SystemMessage(content=MEMORY_SYSTEM_MESSAGE.format(user_profile=user_profile, todo=todo, instructions=instructions))]
+
+def task_mAIstro(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Load memories from the store and use them to personalize the chatbot's response."""
+    
+    # Get the user ID from the config
+    configurable = configuration.Configuration.from_runnable_config(config)
+
+    # Serve memory reads from Redis when MEMORY_CACHE_REDIS_URI is set
+    store = cached_store(store)
+
+    # Retrieve all memories of the user in a single store round trip
+    snapshot = memory_cache.load(store, configurable.todo_category, configurable.user_id)
+    todo_items = select_todos(store, configurable, snapshot.todo, state["messages"])
+    system_msgs = build_system_messages(snapshot, configurable, todo_items)
 
     # Respond using memory as well as the chat history
-    response = model.bind_tools([UpdateMemory], parallel_tool_calls=False).invoke([SystemMessage(content=system_msg)]+state["messages"])
+    response = registry.bind_tools(model, [UpdateMemory], parallel_tool_calls=configurable.parallel_memory_updates).invoke(
+        system_msgs+state["messages"], config=with_callbacks(prompt_cache_stats.handler("task_mAIstro")))
 
     return {"messages": [response]}
 
-def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStore):
+async def atask_mAIstro(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Async version of task_mAIstro."""
 
-    """Reflect on the chat history and update the memory collection."""
-    
-    # Get the user ID from the config
     configurable = configuration.Configuration.from_runnable_config(config)
-    user_id = configurable.user_id
-    todo_category = configurable.todo_category
+    store = cached_store(store)
+    snapshot = await memory_cache.aload(store, configurable.todo_category, configurable.user_id)
+    todo_items = select_todos(store, configurable, snapshot.todo, state["messages"])
+    system_msgs = build_system_messages(snapshot, configurable, todo_items)
+    response = await registry.bind_tools(model, [UpdateMemory], parallel_tool_calls=configurable.parallel_memory_updates).ainvoke(
+        system_msgs+state["messages"], config=with_callbacks(prompt_cache_stats.handler("task_mAIstro")))
+    return {"messages": [response]}
 
-    # Define the namespace for the memories
-    namespace = ("profile", todo_category, user_id)
+## Memory update jobs
+# Each job runs the extraction for one memory type and writes the result to the store.
+# The update nodes either run them inline or hand them to the write-behind queue.
 
-    # Retrieve the most recent memories for context
-    existing_items = store.search(namespace)
+def trustcall_input(messages, existing_items, tool_name: str) -> dict:
+
+    """Format the chat history and existing memories for a Trustcall extractor."""
 
     # Format the existing memories for the Trustcall extractor
-    tool_name = "Profile"
     existing_memories = ([(existing_item.key, tool_name, existing_item.value)
                           for existing_item in existing_items]
                           if existing_items
@@ -275,128 +383,370 @@ def update_profile(state: MessagesState, config: RunnableConfig, store: BaseStor
 
     # Merge the chat history and the instruction
     TRUSTCALL_INSTRUCTION_FORMATTED=TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
-    updated_messages=list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state["messages"][:-1]))
+    updated_messages=list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + messages))
+    return {"messages": updated_messages, "existing": existing_memories}
 
-    # Invoke the extractor
-    result = profile_extractor.invoke({"messages": updated_messages, 
-                                         "existing": existing_memories})
-
-    # Save save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(namespace,
-                  rmeta.get("json_doc_id", str(uuid.uuid4())),
-                  r.model_dump(mode="json"),
-            )
-    tool_calls = state['messages'][-1].tool_calls
-    # Return tool message with update verification
-    return {"messages": [{"role": "tool", "content": "updated profile", "tool_call_id":tool_calls[0]['id']}]}
+def trustcall_values(result) -> dict[str, dict]:
 
-def update_todos(state: MessagesState, config: RunnableConfig, store: BaseStore):
+    """Map each document returned by Trustcall to the key it is stored under."""
+    return {rmeta.get("json_doc_id", str(uuid.uuid4())): r.model_dump(mode="json")
+            for r, rmeta in zip(result["responses"], result["response_metadata"])}
 
-    """Reflect on the chat history and update the memory collection."""
-    
-    # Get the user ID from the config
-    configurable = configuration.Configuration.from_runnable_config(config)
-    user_id = configurable.user_id
-    todo_category = configurable.todo_category
+def instructions_prompt(messages, existing_items) -> list:
 
-    # Define the namespace for the memories
-    namespace = ("todo", todo_category, user_id)
+    """Build the prompt that rewrites the ToDo update instructions."""
+    existing_memory = next((item for item in existing_items if item.key == "user_instructions"), None)
+    system_msg = CREATE_INSTRUCTIONS.format(current_instructions=existing_memory.value if existing_memory else None)
+    return [SystemMessage(content=system_msg)] + messages + [HumanMessage(content="Please update the instructions based on the conversation")]
 
-    # Retrieve the most recent memories for context
-    existing_items = store.search(namespace)
+def todo_tiers(store: BaseStore, configurable: configuration.Configuration) -> TodoTiers:
 
-    # Format the existing memories for the Trustcall extractor
-    tool_name = "ToDo"
-    existing_memories = ([(existing_item.key, tool_name, existing_item.value)
-                          for existing_item in existing_items]
-                          if existing_items
-                          else None
-                        )
+    """Hot and cold ToDo tiers of the configured user, with the configured tiering policy."""
+    policy = TieringPolicy(configurable.cold_todo_after_days, configurable.cold_todo_restore_threshold)
+    return TodoTiers(store, configurable.todo_category, configurable.user_id, policy)
 
-    # Merge the chat history and the instruction
-    TRUSTCALL_INSTRUCTION_FORMATTED=TRUSTCALL_INSTRUCTION.format(time=datetime.now().isoformat())
-    updated_messages=list(merge_message_runs(messages=[SystemMessage(content=TRUSTCALL_INSTRUCTION_FORMATTED)] + state["messages"][:-1]))
+def todo_write_ops(tiers: TodoTiers, hot_items: list[Item], archived: list[Item], values: dict[str, dict]) -> tuple[list[PutOp], str]:
 
-    # Initialize the spy for visibility into the tool calls made by Trustcall
-    spy = Spy()
-    
-    # Create the Trustcall extractor for updating the ToDo list 
-    todo_extractor = create_extractor(
-    model,
-    tools=[ToDo],
-    tool_choice=tool_name,
-    enable_inserts=True
-    ).with_listeners(on_end=spy)
+    """Store ops saving Trustcall's ToDos, restoring the archived ones it updated and archiving
+    what the tiering policy marks cold, plus a note on the moves for the tool message."""
+    now = datetime.now(timezone.utc)
+
+    # Archived items shown to Trustcall are only restored if it updated them
+    restored = {item.key: item for item in archived if item.key in values}
+    hot_values = {key: value for key, value in values.items() if key not in restored}
+    restored_values = {key: tiers.restored_value(values[key]) for key in restored}
+
+    # The hot tier as it will be after this write; items written now count as just updated
+    after = {item.key: item for item in hot_items}
+    previous = {**after, **restored}
+    after.update({key: Item(namespace=tiers.hot.namespace, key=key, value=value,
+                            created_at=previous[key].created_at if key in previous else now, updated_at=now)
+                  for key, value in {**hot_values, **restored_values}.items()})
+
+    cold, moved = tiers.cold_ops(after.values(), now)
+    ops = tiers.hot.put_ops(hot_values) + tiers.restore_ops(restored_values) + cold
+
+    notes = []
+    if restored:
+        notes.append("Restored from the archive: " + ", ".join(restored_values[key].get("task", key) for key in restored))
+    if moved:
+        notes.append(f"Moved {len(moved)} finished ToDo items to the archive")
+    return ops, "".join(f"\n\n{note}" for note in notes)
+
+def update_profile_job(messages, store: BaseStore, configurable: configuration.Configuration) -> str:
+
+    """Extract the user profile from the chat history and save it to the store."""
+    todo_category, user_id = configurable.todo_category, configurable.user_id
+
+    # Define the namespace for the memories
+    namespace = memory_namespace("profile", todo_category, user_id)
+
+    # Retrieve the most recent memories for context, fresh from the store since Trustcall patches them
+    existing_items = memory_cache.load(store, todo_category, user_id, refresh=True).profile
 
     # Invoke the extractor
-    result = todo_extractor.invoke({"messages": updated_messages, 
-                                         "existing": existing_memories})
-
-    # Save save the memories from Trustcall to the store
-    for r, rmeta in zip(result["responses"], result["response_metadata"]):
-        store.put(namespace,
-                  rmeta.get("json_doc_id", str(uuid.uuid4())),
-                  r.model_dump(mode="json"),
-            )
-        
-    # Respond to the tool call made in task_mAIstro, confirming the update    
-    tool_calls = state['messages'][-1].tool_calls
+    result = profile_extractor.invoke(trustcall_input(messages, existing_items, "Profile"),
+                                      config=with_callbacks(prompt_cache_stats.handler("update_profile")))
 
-    # Extract the changes made by Trustcall and add the the ToolMessage returned to task_mAIstro
-    todo_update_msg = extract_tool_info(spy.called_tools, tool_name)
-    return {"messages": [{"role": "tool", "content": todo_update_msg, "tool_call_id":tool_calls[0]['id']}]}
+    # Save save the memories from Trustcall to the store in one batch
+    store.batch([PutOp(namespace, key, value) for key, value in trustcall_values(result).items()])
+    memory_cache.invalidate(store, todo_category, user_id)
+    return "updated profile"
 
-def update_instructions(state: MessagesState, config: RunnableConfig, store: BaseStore):
+async def aupdate_profile_job(messages, store: BaseStore, configurable: configuration.Configuration) -> str:
 
-    """Reflect on the chat history and update the memory collection."""
-    
-    # Get the user ID from the config
-    configurable = configuration.Configuration.from_runnable_config(config)
-    user_id = configurable.user_id
-    todo_category = configurable.todo_category
-    
-    namespace = ("instructions", todo_category, user_id)
+    """Async version of update_profile_job."""
+    todo_category, user_id = configurable.todo_category, configurable.user_id
+    namespace = memory_namespace("profile", todo_category, user_id)
+    existing_items = (await memory_cache.aload(store, todo_category, user_id, refresh=True)).profile
+    result = await profile_extractor.ainvoke(trustcall_input(messages, existing_items, "Profile"),
+                                             config=with_callbacks(prompt_cache_stats.handler("update_profile")))
+    await store.abatch([PutOp(namespace, key, value) for key, value in trustcall_values(result).items()])
+    memory_cache.invalidate(store, todo_category, user_id)
+    return "updated profile"
+
+def update_todos_job(messages, store: BaseStore, configurable: configuration.Configuration) -> str:
+
+    """Extract ToDo items from the chat history and save them to the store."""
+    todo_category, user_id = configurable.todo_category, configurable.user_id
+
+    # ToDos are written through the repository, which keeps their secondary indexes,
+    # and finished ones move between the hot and cold tiers. Read fresh, not from
+    # the cached snapshot, so Trustcall never patches an outdated item
+    tiers = todo_tiers(store, configurable)
+    hot_items = memory_cache.load(store, todo_category, user_id, refresh=True).todo
 
-    existing_memory = store.get(namespace, "user_instructions")
+    # Show Trustcall the archived ToDos the new messages refer to; the ones it updates are restored
+    archived = tiers.referenced(tiers.cold_items(), latest_user_text(messages))
+
+    # Retrieve the memories most relevant to the conversation for context
+    existing_items = select_todos(store, configurable, hot_items + archived, messages)
+
+    # Capture the changes made by Trustcall as its tool calls come back
+    tool_name = "ToDo"
+    capture = ChangeCapture(tool_name)
+
+    # Invoke the extractor, attaching the capture for this call only
+    result = todo_extractor.invoke(trustcall_input(messages, existing_items, tool_name),
+                                   config=with_callbacks(capture, prompt_cache_stats.handler("update_todos")))
+
+    # Save save the memories from Trustcall to the store in one batch, with the tier moves, and index them
+    values = trustcall_values(result)
+    ops, moves = todo_write_ops(tiers, hot_items, archived, values)
+    store.batch(ops)
+    todo_indexes.get(store, todo_category, user_id).upsert_many(values)
+    memory_cache.invalidate(store, todo_category, user_id)
+
+    # Extract the changes made by Trustcall for the ToolMessage returned to task_mAIstro
+    return format_changes(capture.changes, tool_name) + moves
+
+async def aupdate_todos_job(messages, store: BaseStore, configurable: configuration.Configuration) -> str:
+
+    """Async version of update_todos_job."""
+    todo_category, user_id = configurable.todo_category, configurable.user_id
+    tiers = todo_tiers(store, configurable)
+    hot_items = (await memory_cache.aload(store, todo_category, user_id, refresh=True)).todo
+    archived = tiers.referenced(await tiers.acold_items(), latest_user_text(messages))
+    existing_items = select_todos(store, configurable, hot_items + archived, messages)
+    tool_name = "ToDo"
+    capture = ChangeCapture(tool_name)
+    result = await todo_extractor.ainvoke(trustcall_input(messages, existing_items, tool_name),
+                                          config=with_callbacks(capture, prompt_cache_stats.handler("update_todos")))
+    values = trustcall_values(result)
+    ops, moves = todo_write_ops(tiers, hot_items, archived, values)
+    await store.abatch(ops)
+    todo_indexes.get(store, todo_category, user_id).upsert_many(values)
+    memory_cache.invalidate(store, todo_category, user_id)
+    return format_changes(capture.changes, tool_name) + moves
+
+def update_instructions_job(messages, store: BaseStore, configurable: configuration.Configuration) -> str:
+
+    """Rewrite the ToDo update instructions from the chat history and save them to the store."""
+    todo_category, user_id = configurable.todo_category, configurable.user_id
+
+    namespace = memory_namespace("instructions", todo_category, user_id)
+    existing_items = memory_cache.load(store, todo_category, user_id, refresh=True).instructions
         
     # Format the memory in the system prompt
-    system_msg = CREATE_INSTRUCTIONS.format(current_instructions=existing_memory.value if existing_memory else None)
-    new_memory = model.invoke([SystemMessage(content=system_msg)]+state['messages'][:-1] + [HumanMessage(content="Please update the instructions based on the conversation")])
+    new_memory = model.invoke(instructions_prompt(messages, existing_items),
+                              config=with_callbacks(prompt_cache_stats.handler("update_instructions")))
 
     # Overwrite the existing memory in the store 
     key = "user_instructions"
     store.put(namespace, key, {"memory": new_memory.content})
-    tool_calls = state['messages'][-1].tool_calls
-    # Return tool message with update verification
-    return {"messages": [{"role": "tool", "content": "updated instructions", "tool_call_id":tool_calls[0]['id']}]}
+    memory_cache.invalidate(store, todo_category, user_id)
+    return "updated instructions"
+
+async def aupdate_instructions_job(messages, store: BaseStore, configurable: configuration.Configuration) -> str:
+
+    """Async version of update_instructions_job."""
+    todo_category, user_id = configurable.todo_category, configurable.user_id
+    namespace = memory_namespace("instructions", todo_category, user_id)
+    existing_items = (await memory_cache.aload(store, todo_category, user_id, refresh=True)).instructions
+    new_memory = await model.ainvoke(instructions_prompt(messages, existing_items),
+                                     config=with_callbacks(prompt_cache_stats.handler("update_instructions")))
+    await store.aput(namespace, "user_instructions", {"memory": new_memory.content})
+    memory_cache.invalidate(store, todo_category, user_id)
+    return "updated instructions"
+
+# Tool message content returned when there was nothing new to extract
+NO_NEW_MESSAGES = "no new messages since the last update"
+
+def messages_since(messages: list[BaseMessage], watermark: Optional[str]) -> list[BaseMessage]:
+
+    """Messages after the one with id `watermark`; all of them if it is unset or no longer in the thread."""
+    start = 0
+    if watermark:
+        for i, message in enumerate(messages):
+            if message.id == watermark:
+                start = i + 1
+                break
+    new_messages = messages[start:]
+    # A tool message cannot open a conversation without the AI message that called the tool
+    while new_messages and isinstance(new_messages[0], ToolMessage):
+        new_messages = new_messages[1:]
+    return new_messages
+
+# Where background jobs record how far they extracted, once they have succeeded
+WATERMARK_MEMORY_TYPE = "extraction_watermark"
+
+def watermark_key(config: RunnableConfig, update_type: str) -> str:
+
+    """Store key of the extraction watermark of one thread and memory type."""
+    return f"{config['configurable'].get('thread_id', '')}:{update_type}"
+
+def stored_watermark(item: Optional[Item]) -> Optional[str]:
+
+    """Message id recorded by the last background job that succeeded, if any."""
+    return item.value["message_id"] if item else None
+
+def later_watermark(history: list[BaseMessage], *watermarks: Optional[str]) -> Optional[str]:
+
+    """The watermark furthest along the history, ignoring ids no longer in it."""
+    positions = {message.id: i for i, message in enumerate(history)}
+    known = [watermark for watermark in watermarks if watermark in positions]
+    return max(known, key=positions.get, default=None)
+
+def update_window(update_type: str, state: State, stored: Optional[str] = None) -> tuple[list[BaseMessage], dict]:
+
+    """Messages an update job has not seen yet, and the state update that advances its watermark.
+
+    The history excludes the AI message that requested the update. `stored` is the
+    watermark recorded in the store by background jobs, which only move it once
+    they have succeeded; the later of it and the state's watermark is used.
+    """
+    history = state["messages"][:-1]
+    watermark = later_watermark(history, (state.get("extraction_watermarks") or {}).get(update_type), stored)
+    advance = {"extraction_watermarks": {update_type: history[-1].id}} if history else {}
+    return messages_since(history, watermark), advance
+
+def background_job(job, namespace: tuple[str, ...], key: str, messages, store: BaseStore,
+                   configurable: configuration.Configuration) -> str:
+
+    """Run a queued update job, then record its watermark in the store.
+
+    Queued jobs can fail or be lost with the process, so the watermark only moves
+    once the job has succeeded; until then later updates re-read the messages.
+    Jobs for one user run in order, so by the time this one runs, messages saved
+    by an earlier job for the same thread are dropped from its window.
+    """
+    messages = messages_since(messages, stored_watermark(store.get(namespace, key)))
+    if not messages:
+        return NO_NEW_MESSAGES
+    content = job(messages, store, configurable)
+    store.put(namespace, key, {"message_id": messages[-1].id})
+    return content
+
+# Tool message content returned when an update was handed to the write-behind queue
+QUEUED_UPDATE_MESSAGES = {
+    "user": "profile update queued",
+    "todo": "ToDo list update queued; it will be saved in the background",
+    "instructions": "instructions update queued",
+}
+
+def run_update(job, update_type: str, state: State, config: RunnableConfig, store: BaseStore):
+
+    """Run a memory update job inline, or queue it when background updates are enabled."""
+
+    # Get the user ID from the config
+    configurable = configuration.Configuration.from_runnable_config(config)
+    user_id = configurable.user_id
+    todo_category = configurable.todo_category
+
+    # Writes go through the Redis cache too, so they invalidate its entries
+    store = cached_store(store)
+
+    # Only the messages added since this memory type was last extracted
+    namespace = memory_namespace(WATERMARK_MEMORY_TYPE, todo_category, user_id)
+    key = watermark_key(config, update_type)
+    stored = stored_watermark(store.get(namespace, key)) if configurable.background_memory_updates else None
+    messages, advance = update_window(update_type, state, stored)
+
+    if not messages:
+        content = NO_NEW_MESSAGES
+    elif configurable.background_memory_updates:
+        # Jobs for one user run in order, so later updates see earlier ones.
+        # The job moves the watermark in the store once it succeeds, not the state now
+        write_behind.submit((todo_category, user_id),
+                            partial(background_job, job, namespace, key, messages, store, configurable))
+        content = QUEUED_UPDATE_MESSAGES[update_type]
+        advance = {}
+    else:
+        content = job(messages, store, configurable)
+
+    # Respond to the tool call made in task_mAIstro, confirming the update
+    return {"messages": tool_messages(state['messages'][-1], update_type, content), **advance}
+
+async def arun_update(job, ajob, update_type: str, state: State, config: RunnableConfig, store: BaseStore):
+
+    """Async version of run_update.
+
+    Queued work uses the sync job: it runs on the write-behind pool's own threads,
+    outside the event loop the store's async methods are bound to.
+    """
+    configurable = configuration.Configuration.from_runnable_config(config)
+    user_id = configurable.user_id
+    todo_category = configurable.todo_category
+    store = cached_store(store)
+    namespace = memory_namespace(WATERMARK_MEMORY_TYPE, todo_category, user_id)
+    key = watermark_key(config, update_type)
+    stored = stored_watermark(await store.aget(namespace, key)) if configurable.background_memory_updates else None
+    messages, advance = update_window(update_type, state, stored)
+
+    if not messages:
+        content = NO_NEW_MESSAGES
+    elif configurable.background_memory_updates:
+        await write_behind.asubmit((todo_category, user_id),
+                                   partial(background_job, job, namespace, key, messages, store, configurable))
+        content = QUEUED_UPDATE_MESSAGES[update_type]
+        advance = {}
+    else:
+        content = await ajob(messages, store, configurable)
+
+    return {"messages": tool_messages(state['messages'][-1], update_type, content), **advance}
+
+## Node definitions for memory updates
+
+def update_profile(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Reflect on the chat history and update the memory collection."""
+    return run_update(update_profile_job, "user", state, config, store)
+
+async def aupdate_profile(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Async version of update_profile."""
+    return await arun_update(update_profile_job, aupdate_profile_job, "user", state, config, store)
+
+def update_todos(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Reflect on the chat history and update the memory collection."""
+    return run_update(update_todos_job, "todo", state, config, store)
+
+async def aupdate_todos(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Async version of update_todos."""
+    return await arun_update(update_todos_job, aupdate_todos_job, "todo", state, config, store)
+
+def update_instructions(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Reflect on the chat history and update the memory collection."""
+    return run_update(update_instructions_job, "instructions", state, config, store)
+
+async def aupdate_instructions(state: State, config: RunnableConfig, store: BaseStore):
+
+    """Async version of update_instructions."""
+    return await arun_update(update_instructions_job, aupdate_instructions_job, "instructions", state, config, store)
 
 # Conditional edge
-def route_message(state: MessagesState, config: RunnableConfig, store: BaseStore) -> Literal[END, "update_todos", "update_instructions", "update_profile"]:
+def route_message(state: State, config: RunnableConfig, store: BaseStore) -> Literal[END, "update_todos", "update_instructions", "update_profile"]:
 
     """Reflect on the memories and chat history to decide whether to update the memory collection."""
     message = state['messages'][-1]
     if len(message.tool_calls) ==0:
         return END
-    else:
+
+    configurable = configuration.Configuration.from_runnable_config(config)
+    if not configurable.parallel_memory_updates:
         tool_call = message.tool_calls[0]
-        if tool_call['args']['update_type'] == "user":
-            return "update_profile"
-        elif tool_call['args']['update_type'] == "todo":
-            return "update_todos"
-        elif tool_call['args']['update_type'] == "instructions":
-            return "update_instructions"
-        else:
+        if tool_call['args']['update_type'] not in UPDATE_NODES:
             raise ValueError
+        return UPDATE_NODES[tool_call['args']['update_type']]
+
+    # Fan out one update node per requested memory type; they run concurrently
+    # and all return to task_mAIstro, which then generates a single reply
+    update_types = dict.fromkeys(tool_call['args']['update_type'] for tool_call in message.tool_calls)
+    if any(update_type not in UPDATE_NODES for update_type in update_types):
+        raise ValueError
+    return [Send(UPDATE_NODES[update_type], state) for update_type in update_types]
 
 # Create the graph + all nodes
-builder = StateGraph(MessagesState, config_schema=configuration.Configuration)
+builder = StateGraph(State, config_schema=configuration.Configuration)
 
 # Define the flow of the memory extraction process
-builder.add_node(task_mAIstro)
-builder.add_node(update_todos)
-builder.add_node(update_profile)
-builder.add_node(update_instructions)
+builder.add_node("task_mAIstro", RunnableCallable(task_mAIstro, atask_mAIstro))
+builder.add_node("update_todos", RunnableCallable(update_todos, aupdate_todos))
+builder.add_node("update_profile", RunnableCallable(update_profile, aupdate_profile))
+builder.add_node("update_instructions", RunnableCallable(update_instructions, aupdate_instructions))
 
 # Define the flow 
 builder.add_edge(START, "task_mAIstro")
@@ -405,5 +755,8 @@ builder.add_edge("update_todos", "task_mAIstro")
 builder.add_edge("update_profile", "task_mAIstro")
 builder.add_edge("update_instructions", "task_mAIstro")
 
-# Compile the graph
-graph = builder.compile()
\ No newline at end of file
+# Compile the graph. With MEMORY_STORE_URI set, memories live in the pooled Postgres
+# store; otherwise the graph uses the store it is given at runtime (e.g. by the
+# LangGraph server). With MEMORY_CACHE_REDIS_URI set, the nodes read it through
+# a Redis cache (see redis_cache.py).
+graph = builder.compile(store=postgres_store.get_store())
\ No newline at end of file
@@ -0,0 +1,123 @@
+import re
+import threading
+import zlib
+from typing import Iterable, Optional
+from weakref import WeakKeyDictionary
+
+import numpy as np
+
+from langgraph.store.base import BaseStore, Item
+
+## Local embedding index for ToDo relevance
+
+EMBEDDING_DIMS = 512
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def embed_text(text: str, dims: int = EMBEDDING_DIMS) -> np.ndarray:
+    """Embed text offline with the hashing trick over word unigrams and bigrams.
+
+    Not a semantic model, but free, deterministic and fast, which is what ranking
+    a user's own ToDo items against their latest message needs.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    vector = np.zeros(dims, dtype=np.float32)
+    for feature in features:
+        h = zlib.crc32(feature.encode())
+        vector[h % dims] += 1.0 if (h >> 31) & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def todo_text(todo: dict) -> str:
+    """Text of a ToDo that is used for relevance: the task and its solutions."""
+    return " ".join([todo.get("task", "")] + list(todo.get("solutions") or []))
+
+class TodoIndex:
+    """In-process cosine index over one user's ToDo items.
+
+    Rows are keyed by store key and tagged with the item's `updated_at`, so `sync`
+    only re-embeds items that are new or changed since the last call. Items
+    embedded by `upsert_many` when they are written adopt the store's timestamp
+    on the next `sync` instead of being embedded again.
+    """
+
+    def __init__(self, dims: int = EMBEDDING_DIMS):
+        self.dims = dims
+        self._lock = threading.Lock()
+        self._rows: dict[str, int] = {}
+        self._stamps: dict[str, Optional[str]] = {}
+        self._matrix = np.zeros((0, dims), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _upsert(self, key: str, todo: dict, stamp: Optional[str]) -> None:
+        vector = embed_text(todo_text(todo), self.dims)
+        row = self._rows.get(key)
+        if row is None:
+            self._rows[key] = len(self._matrix)
+            self._matrix = np.vstack([self._matrix, vector])
+        else:
+            self._matrix[row] = vector
+        self._stamps[key] = stamp
+
+    def _remove(self, keys: set[str]) -> None:
+        keep = [key for key in self._rows if key not in keys]
+        self._matrix = self._matrix[[self._rows[key] for key in keep]]
+        self._rows = {key: row for row, key in enumerate(keep)}
+        for key in keys:
+            self._stamps.pop(key, None)
+
+    def upsert_many(self, todos: dict[str, dict]) -> None:
+        """Add or re-embed ToDos (key -> value) right after they are written."""
+        with self._lock:
+            for key, todo in todos.items():
+                self._upsert(key, todo, None)
+
+    def sync(self, items: Iterable[Item]) -> None:
+        """Bring the index in line with the stored items, embedding only what changed."""
+        with self._lock:
+            seen = set()
+            for item in items:
+                seen.add(item.key)
+                stamp = str(item.updated_at)
+                if item.key in self._stamps and self._stamps[item.key] is None:
+                    self._stamps[item.key] = stamp
+                elif self._stamps.get(item.key) != stamp:
+                    self._upsert(item.key, item.value, stamp)
+            stale = set(self._rows) - seen
+            if stale:
+                self._remove(stale)
+
+    def top_k(self, query: str, k: int) -> list[str]:
+        """Keys of the `k` items most similar to `query`, best first."""
+        with self._lock:
+            if not self._rows:
+                return []
+            scores = self._matrix @ embed_text(query, self.dims)
+            # Rows are kept in key insertion order; a stable sort keeps that order
+            # among equally relevant items
+            keys = list(self._rows)
+            return [keys[row] for row in np.argsort(-scores, kind="stable")[:k]]
+
+class TodoIndexes:
+    """One TodoIndex per (store, todo_category, user_id), kept for the life of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes: WeakKeyDictionary = WeakKeyDictionary()
+
+    def get(self, store: BaseStore, todo_category: str, user_id: str) -> TodoIndex:
+        with self._lock:
+            return self._indexes.setdefault(store, {}).setdefault((todo_category, user_id), TodoIndex())
+
+    def relevant(self, store: BaseStore, todo_category: str, user_id: str,
+                 items: list[Item], query: str, k: int) -> list[Item]:
+        """Return the `k` items most relevant to `query`; all items when k <= 0 or few enough."""
+        if k <= 0 or len(items) <= k:
+            return items
+        index = self.get(store, todo_category, user_id)
+        index.sync(items)
+        by_key = {item.key: item for item in items}
+        return [by_key[key] for key in index.top_k(query, k) if key in by_key]
@@ -0,0 +1,72 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, Iterable, Optional
+
+## ToDo rendering for the system prompt
+
+ACTIVE_STATUSES = ("not started", "in progress")
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+def _parse_deadline(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+def _deadline_sort_key(todo: dict) -> tuple:
+    # Items with a deadline first, soonest first; undated items keep their order at the end
+    deadline = _parse_deadline(todo.get("deadline"))
+    return (0, deadline.timestamp()) if deadline else (1, 0)
+
+def render_todo_line(todo: dict) -> str:
+    """Render one ToDo as a single compact line."""
+    details = [todo.get("status", "not started")]
+    deadline = _parse_deadline(todo.get("deadline"))
+    if deadline:
+        details.append(f"due {deadline:%Y-%m-%d %H:%M}")
+    if todo.get("time_to_complete"):
+        details.append(f"~{todo['time_to_complete']} min")
+    line = f"- {todo.get('task', '')} ({', '.join(details)})"
+    if todo.get("solutions"):
+        line += f" | solutions: {'; '.join(todo['solutions'])}"
+    return line
+
+def render_todos(todos: Iterable[dict], token_budget: int) -> str:
+    """Render the ToDo list for the system prompt within a token budget.
+
+    Active items are listed one per line, soonest deadline first, until the
+    budget runs out; the remainder is summarized by count. Done and archived
+    items are never listed, only counted.
+    """
+    active = []
+    inactive = Counter()
+    for todo in todos:
+        status = todo.get("status", "not started")
+        if status in ACTIVE_STATUSES:
+            active.append(todo)
+        else:
+            inactive[status] += 1
+    active.sort(key=_deadline_sort_key)
+
+    lines = []
+    used = 0
+    for shown, todo in enumerate(active):
+        line = render_todo_line(todo)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            lines.append(f"... {len(active) - shown} more active items not shown")
+            break
+        lines.append(line)
+        used += cost
+
+    if inactive:
+        counts = ", ".join(f"{count} {status}" for status, count in sorted(inactive.items()))
+        lines.append(f"({counts} items not shown)")
+    return "\n".join(lines)
@@ -0,0 +1,237 @@
+import base64
+import json
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Iterator, Optional
+
+from langgraph.store.base import BaseStore, GetOp, Item, PutOp
+
+from memory_cache import memory_namespace
+
+## ToDo repository
+
+# Statuses of items that still need work
+OPEN_STATUSES = ("not started", "in progress")
+
+# Sentinels for missing values; range filters in the stores compare numbers
+NO_DEADLINE = 253402300799.0 # 9999-12-31T23:59:59Z
+NO_ESTIMATE = 2**31 - 1
+
+def _deadline_ts(value: Any) -> float:
+    if isinstance(value, str) and value:
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return NO_DEADLINE
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return NO_DEADLINE
+
+def index_record(todo: dict) -> dict:
+    """Project the indexed fields of a ToDo into a small, filterable record."""
+    status = todo.get("status", "not started")
+    return {
+        "status": status,
+        "open": status in OPEN_STATUSES,
+        "deadline": _deadline_ts(todo.get("deadline")),
+        "time_to_complete": todo.get("time_to_complete") or NO_ESTIMATE,
+    }
+
+def _encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def _decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+
+@dataclass(frozen=True)
+class TodoPage:
+    """One page of ToDo items; pass `next_cursor` back to get the next page.
+
+    The cursor is an offset into the store's own order, which for Postgres is most
+    recently updated first. Pages are therefore not stable under concurrent
+    writes: an item written between two pages moves to the front, so a later
+    page may repeat an item or miss one. Use `TodoRepository.snapshot` where a
+    consistent read matters.
+    """
+    items: list[Item]
+    next_cursor: Optional[str]
+
+class TodoRepository:
+    """ToDo items of one user, with secondary indexes kept next to them in the store.
+
+    Every ToDo lives at `("todo", todo_category, user_id)` as before. Writes through
+    the repository also maintain an index record under
+    `("todo_index", todo_category, user_id)` with the same key, holding only
+    `status`, an `open` flag, the deadline as a UTC timestamp and
+    `time_to_complete`. Queries run the value filter over every index record of
+    the user, then fetch the matching items in a second batch. That scans a
+    smaller projection than the ToDos themselves, but still the whole namespace:
+    no store index covers the filtered fields.
+
+    Items written directly with `store.put` are not indexed until `reindex` runs.
+    """
+
+    def __init__(self, store: BaseStore, todo_category: str, user_id: str):
+        self.store = store
+        self.namespace = memory_namespace("todo", todo_category, user_id)
+        self.index_namespace = memory_namespace("todo_index", todo_category, user_id)
+
+    def put_ops(self, todos: dict[str, dict]) -> list[PutOp]:
+        """Store ops writing ToDos (key -> value) and their index records, for batching with other writes."""
+        ops = []
+        for key, todo in todos.items():
+            ops.append(PutOp(self.namespace, key, todo))
+            ops.append(PutOp(self.index_namespace, key, index_record(todo)))
+        return ops
+
+    def put_many(self, todos: dict[str, dict]) -> None:
+        """Write ToDos (key -> value) and their index records in one batch."""
+        if todos:
+            self.store.batch(self.put_ops(todos))
+
+    async def aput_many(self, todos: dict[str, dict]) -> None:
+        """Async version of `put_many`."""
+        if todos:
+            await self.store.abatch(self.put_ops(todos))
+
+    def put(self, key: str, todo: dict) -> None:
+        """Write one ToDo and its index record."""
+        self.put_many({key: todo})
+
+    def delete_ops(self, keys: list[str]) -> list[PutOp]:
+        """Store ops deleting ToDos and their index records, for batching with other writes."""
+        ops = []
+        for key in keys:
+            ops.append(PutOp(self.namespace, key, None))
+            ops.append(PutOp(self.index_namespace, key, None))
+        return ops
+
+    def delete(self, key: str) -> None:
+        """Delete one ToDo and its index record."""
+        self.store.batch(self.delete_ops([key]))
+
+    def get_many(self, keys: list[str]) -> list[Item]:
+        """Fetch ToDos by key in one batch, skipping keys that no longer exist."""
+        results = self.store.batch([GetOp(self.namespace, key) for key in keys])
+        return [item for item in results if item is not None]
+
+    async def aget_many(self, keys: list[str]) -> list[Item]:
+        """Async version of `get_many`."""
+        results = await self.store.abatch([GetOp(self.namespace, key) for key in keys])
+        return [item for item in results if item is not None]
+
+    @staticmethod
+    def _filter(status: Optional[str], is_open: Optional[bool], due_before: Optional[datetime],
+                due_after: Optional[datetime], max_minutes: Optional[int]) -> Optional[dict[str, Any]]:
+        filter: dict[str, Any] = {}
+        if status is not None:
+            filter["status"] = status
+        if is_open is not None:
+            filter["open"] = is_open
+        deadline: dict[str, float] = {}
+        if due_before is not None:
+            deadline["$lte"] = _deadline_ts(due_before)
+        if due_after is not None:
+            deadline["$gte"] = _deadline_ts(due_after)
+        if deadline:
+            filter["deadline"] = deadline
+        if max_minutes is not None:
+            filter["time_to_complete"] = {"$lte": max_minutes}
+        return filter or None
+
+    def query(self, *, status: Optional[str] = None, is_open: Optional[bool] = None,
+              due_before: Optional[datetime] = None, due_after: Optional[datetime] = None,
+              max_minutes: Optional[int] = None, limit: int = 50,
+              cursor: Optional[str] = None) -> TodoPage:
+        """Return one page of ToDos matching every given condition.
+
+        Args:
+            status: Exact status to match
+            is_open: Only items that still need work (True) or that do not (False)
+            due_before: Deadline at or before this time
+            due_after: Deadline at or after this time
+            max_minutes: `time_to_complete` of at most this many minutes
+            limit: Page size
+            cursor: `next_cursor` of the previous page
+        """
+        offset = _decode_cursor(cursor)
+        # Ask for one extra record to know whether another page exists
+        matches = self.store.search(self.index_namespace, limit=limit + 1, offset=offset,
+                                    filter=self._filter(status, is_open, due_before, due_after, max_minutes))
+        next_cursor = _encode_cursor(offset + limit) if len(matches) > limit else None
+        return TodoPage(self.get_many([match.key for match in matches[:limit]]), next_cursor)
+
+    async def aquery(self, *, status: Optional[str] = None, is_open: Optional[bool] = None,
+                     due_before: Optional[datetime] = None, due_after: Optional[datetime] = None,
+                     max_minutes: Optional[int] = None, limit: int = 50,
+                     cursor: Optional[str] = None) -> TodoPage:
+        """Async version of `query`."""
+        offset = _decode_cursor(cursor)
+        matches = await self.store.asearch(self.index_namespace, limit=limit + 1, offset=offset,
+                                           filter=self._filter(status, is_open, due_before, due_after, max_minutes))
+        next_cursor = _encode_cursor(offset + limit) if len(matches) > limit else None
+        return TodoPage(await self.aget_many([match.key for match in matches[:limit]]), next_cursor)
+
+    def page(self, limit: int = 50, cursor: Optional[str] = None) -> TodoPage:
+        """Return one page of all ToDos, indexed or not."""
+        offset = _decode_cursor(cursor)
+        items = self.store.search(self.namespace, limit=limit + 1, offset=offset)
+        next_cursor = _encode_cursor(offset + limit) if len(items) > limit else None
+        return TodoPage(items[:limit], next_cursor)
+
+    async def apage(self, limit: int = 50, cursor: Optional[str] = None) -> TodoPage:
+        """Async version of `page`."""
+        offset = _decode_cursor(cursor)
+        items = await self.store.asearch(self.namespace, limit=limit + 1, offset=offset)
+        next_cursor = _encode_cursor(offset + limit) if len(items) > limit else None
+        return TodoPage(items[:limit], next_cursor)
+
+    def iter_all(self, page_size: int = 100) -> Iterator[Item]:
+        """Stream every ToDo of the user, one page at a time.
+
+        Items are yielded once each, but ones written while paging may be missed
+        (see `TodoPage`).
+        """
+        cursor, seen = None, set()
+        while True:
+            page = self.page(page_size, cursor)
+            for item in page.items:
+                if item.key not in seen:
+                    seen.add(item.key)
+                    yield item
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    async def aiter_all(self, page_size: int = 100) -> AsyncIterator[Item]:
+        """Async version of `iter_all`."""
+        cursor, seen = None, set()
+        while True:
+            page = await self.apage(page_size, cursor)
+            for item in page.items:
+                if item.key not in seen:
+                    seen.add(item.key)
+                    yield item
+            if page.next_cursor is None:
+                return
+            cursor = page.next_cursor
+
+    def snapshot(self, max_items: int = 10000) -> list[Item]:
+        """Every ToDo of the user (up to `max_items`) as of one point in time.
+
+        Read with a single search, so unlike paging, concurrent writes cannot
+        make it skip or repeat items.
+        """
+        return self.store.search(self.namespace, limit=max_items)
+
+    def reindex(self, batch_size: int = 100, max_items: int = 10000) -> int:
+        """Rebuild the index records from a snapshot of the stored ToDos; returns the number indexed."""
+        items = self.snapshot(max_items)
+        for start in range(0, len(items), batch_size):
+            self.store.batch([PutOp(self.index_namespace, item.key, index_record(item.value))
+                              for item in items[start:start + batch_size]])
+        return len(items)
@@ -0,0 +1,114 @@
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+from langgraph.store.base import BaseStore, GetOp, Item, PutOp
+
+from memory_cache import memory_namespace
+from todo_index import embed_text, todo_text
+from todo_repository import TodoRepository
+
+## Cold tier for finished ToDos
+
+# Items never read on a chat turn; only update_todos looks here, to restore them
+COLD_MEMORY_TYPE = "todo_archive"
+
+# Newest archived items compared against the conversation when looking for references
+COLD_SCAN_LIMIT = 200
+
+# Words left out when matching messages to archived items, so that phrasing alone
+# ("I need to ... the ...") never makes an unrelated item look referenced
+STOPWORDS = frozenset("""a about after again all also am an and any are as at be been before but by can
+could did do does for from get got had has have he her him his how i if in into is it its just
+me more my need needs no not now of on or our out please she so some than that the their them
+then there these they this to too up us was we were what when where which who will with would
+you your""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+def content_words(text: str) -> list[str]:
+    """Words of the text minus stopwords, in order."""
+    return [word for word in _WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+@dataclass(frozen=True)
+class TieringPolicy:
+    """Which ToDos leave the hot namespace: archived ones right away, done ones after `done_after_days`."""
+    done_after_days: float = 7.0
+    restore_threshold: float = 0.35 # Content-word similarity between a message and an archived item that restores it
+
+    def is_cold(self, item: Item, now: datetime) -> bool:
+        status = item.value.get("status")
+        if status == "archived":
+            return True
+        return status == "done" and now - item.updated_at >= timedelta(days=self.done_after_days)
+
+class TodoTiers:
+    """Hot and cold tiers of one user's ToDos.
+
+    The hot tier is the regular `("todo", todo_category, user_id)` namespace read
+    on every turn. Items the policy marks cold move, under the same key, to
+    `("todo_archive", todo_category, user_id)`, which is only searched when the
+    ToDo list is updated. Moves are returned as store ops so callers can write
+    them in the same batch as their other changes.
+    """
+
+    def __init__(self, store: BaseStore, todo_category: str, user_id: str,
+                 policy: Optional[TieringPolicy] = None):
+        self.store = store
+        self.hot = TodoRepository(store, todo_category, user_id)
+        self.cold_namespace = memory_namespace(COLD_MEMORY_TYPE, todo_category, user_id)
+        self.policy = policy or TieringPolicy()
+
+    def archive_ops(self, todos: dict[str, dict]) -> list[PutOp]:
+        """Store ops moving ToDos (key -> value) to the cold tier."""
+        ops = [PutOp(self.cold_namespace, key, todo) for key, todo in todos.items()]
+        return ops + self.hot.delete_ops(list(todos))
+
+    def cold_ops(self, items: Iterable[Item], now: Optional[datetime] = None) -> tuple[list[PutOp], list[str]]:
+        """Store ops moving every item the policy marks cold, and the keys moved."""
+        now = now or datetime.now(timezone.utc)
+        cold = {item.key: item.value for item in items if self.policy.is_cold(item, now)}
+        return self.archive_ops(cold), list(cold)
+
+    @staticmethod
+    def restored_value(todo: dict) -> dict:
+        """Value of an archived ToDo once restored: archived items come back as done,
+        so they stay hot for the done period instead of moving straight back."""
+        return {**todo, "status": "done"} if todo.get("status") == "archived" else todo
+
+    def restore_ops(self, todos: dict[str, dict]) -> list[PutOp]:
+        """Store ops moving archived ToDos (key -> value) back to the hot tier."""
+        todos = {key: self.restored_value(todo) for key, todo in todos.items()}
+        return self.hot.put_ops(todos) + [PutOp(self.cold_namespace, key, None) for key in todos]
+
+    def cold_items(self, limit: int = COLD_SCAN_LIMIT) -> list[Item]:
+        """The most recently archived items."""
+        return self.store.search(self.cold_namespace, limit=limit)
+
+    async def acold_items(self, limit: int = COLD_SCAN_LIMIT) -> list[Item]:
+        """Async version of `cold_items`."""
+        return await self.store.asearch(self.cold_namespace, limit=limit)
+
+    def referenced(self, items: list[Item], text: str) -> list[Item]:
+        """Archived items `text` may refer to: they share a content word with it, and
+        their content words are similar enough to its content words."""
+        words = content_words(text)
+        if not items or not words:
+            return []
+        query = embed_text(" ".join(words))
+        referenced = []
+        for item in items:
+            item_words = content_words(todo_text(item.value))
+            if (set(item_words) & set(words)
+                    and float(embed_text(" ".join(item_words)) @ query) >= self.policy.restore_threshold):
+                referenced.append(item)
+        return referenced
+
+    def restore(self, keys: list[str]) -> list[Item]:
+        """Move the archived items with these keys back to the hot tier; returns the items moved."""
+        items = [item for item in self.store.batch([GetOp(self.cold_namespace, key) for key in keys])
+                 if item is not None]
+        if items:
+            self.store.batch(self.restore_ops({item.key: item.value for item in items}))
+        return items
@@ -0,0 +1,133 @@
+import asyncio
+import atexit
+import inspect
+import logging
+import queue
+import threading
+import time
+import zlib
+from typing import Any, Callable, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+## Write-behind queue
+
+class WriteBehindQueue:
+    """Bounded, in-process worker pool for deferred memory updates.
+
+    Jobs are plain callables (sync or async) submitted under a key such as
+    `(todo_category, user_id)`. Every key is pinned to one worker shard, so jobs
+    for the same user run one at a time and in submission order, while jobs for
+    different users run concurrently. Each shard holds at most `maxsize` pending
+    jobs; `submit` blocks when it is full, which pushes back on the graph instead
+    of growing memory without bound.
+
+    Each shard is a daemon thread of its own, started on first use; async jobs
+    run to completion on it with `asyncio.run`. Pending jobs are flushed when the
+    interpreter exits.
+    """
+
+    def __init__(self, num_workers: int = 4, maxsize: int = 100):
+        self.num_workers = num_workers
+        self.maxsize = maxsize
+        self._queues: list[queue.Queue] = []
+        self._workers: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        # Jobs submitted but not yet finished, across all shards
+        self._pending = 0
+        self._idle = threading.Condition()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if not self._workers:
+                self._queues = [queue.Queue(self.maxsize) for _ in range(self.num_workers)]
+                self._workers = [threading.Thread(target=self._worker, args=(q,), name=f"write-behind-{i}", daemon=True)
+                                 for i, q in enumerate(self._queues)]
+                for worker in self._workers:
+                    worker.start()
+                # threading's exit hooks run before atexit handlers, and in reverse order,
+                # so this flush happens before concurrent.futures stops taking new work
+                # and jobs that use thread pools (as sync LangGraph calls do) still run.
+                # Python 3.12.0 and 3.12.1 refuse to start any thread during shutdown,
+                # so there jobs that need one fail and are logged
+                if hasattr(threading, "_register_atexit"):
+                    threading._register_atexit(self.shutdown)
+                else:
+                    atexit.register(self.shutdown)
+
+    def _queue_for(self, key: Hashable) -> queue.Queue:
+        # Stable across runs, unlike hash() on strings
+        return self._queues[zlib.crc32(repr(key).encode()) % self.num_workers]
+
+    def _worker(self, jobs: queue.Queue) -> None:
+        while True:
+            item = jobs.get()
+            if item is None:
+                return
+            key, job = item
+            try:
+                if inspect.iscoroutinefunction(job):
+                    asyncio.run(job())
+                else:
+                    job()
+            except Exception:
+                logger.exception("Write-behind job for %s failed", key)
+            finally:
+                with self._idle:
+                    self._pending -= 1
+                    self._idle.notify_all()
+
+    def _put(self, key: Hashable, job: Callable[[], Any], block: bool = True) -> None:
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue_for(key).put((key, job), block=block)
+        except BaseException:
+            with self._idle:
+                self._pending -= 1
+                self._idle.notify_all()
+            raise
+
+    def submit(self, key: Hashable, job: Callable[[], Any]) -> None:
+        """Queue `job` behind earlier jobs with the same key; blocks while the shard is full."""
+        self._ensure_started()
+        self._put(key, job)
+
+    async def asubmit(self, key: Hashable, job: Callable[[], Any]) -> None:
+        """Async version of `submit`; waits without blocking the caller's event loop."""
+        self._ensure_started()
+        try:
+            self._put(key, job, block=False)
+        except queue.Full:
+            await asyncio.to_thread(self._put, key, job)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Block until every job submitted so far has finished.
+
+        Raises TimeoutError if jobs are still pending after `timeout` seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"{self._pending} write-behind jobs still pending")
+                self._idle.wait(remaining)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """Flush pending jobs, then stop the worker threads."""
+        with self._lock:
+            if not self._workers:
+                return
+        try:
+            self.flush(timeout)
+        finally:
+            with self._lock:
+                queues, workers = self._queues, self._workers
+                self._queues, self._workers = [], []
+            for q in queues:
+                q.put(None)
+            for worker in workers:
+                worker.join(timeout)
+            if not hasattr(threading, "_register_atexit"):
+                atexit.unregister(self.shutdown)